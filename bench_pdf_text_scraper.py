@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from pdf_text_scraper import LINE_PAGE_NUMBER, LINE_TABLE, PDFTextParser, TableInfo, TableType, merge_table_info
+
+WORDS = ('the', 'timer', 'routine', 'returns', 'a', 'task', 'clock', 'signal', 'value', 'kernel', 'of',
+         'is', 'for', 'specified', 'POSIX', 'extension', 'named', 'system', 'memory', 'queue', 'and')
+FACILITIES = ('Timer', 'Clock', 'Message Queue', 'Memory', 'Signal', 'Semaphore', 'Task')
+
+
+def _sentence(rng, low=5, high=14):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+def _title(rng):
+    return f'POSIX {rng.choice(FACILITIES)} Routines'
+
+
+def _routines_first_table(rng, name, functions):
+    lines = [name, '', _title(rng), '', 'Call', '']
+    for function in functions:
+        lines += [f'{function}( )', '']
+    lines += ['Description', '']
+    for _ in functions:
+        lines += [_sentence(rng) for _ in range(rng.randint(1, 3))] + ['']
+    return lines
+
+
+def _intermingled_table(rng, name, functions):
+    lines = [name, '', _title(rng), '', 'Routine', '', 'Description', '']
+    for function in functions:
+        if rng.random() < 0.2:
+            lines += [f'{function}( ) {_sentence(rng)}', '']
+        else:
+            lines += [f'{function}( )', ''] + [_sentence(rng) for _ in range(rng.randint(1, 3))] + ['']
+    return lines
+
+
+def generate_manual(pages=100, tables=100, layout='mixed', seed=0):
+    # pdfminer style text of a manual: prose, tables of the requested
+    # TableType layouts spread over the pages (at most one per page, an
+    # Intermingled table runs up to the page footer) and a page number
+    # footer on every page
+    rng = random.Random(seed)
+    table_pages = {n * pages // tables for n in range(min(tables, pages))}
+    lines = []
+    counts = {TableType.RoutinesFirst.value: 0, TableType.Intermingled.value: 0}
+    for page in range(pages):
+        lines += ['VxWorks', "Kernel Programmer's Guide, 6.6", '']
+        if page in table_pages:
+            if layout == 'mixed':
+                table_type = rng.choice(list(TableType))
+            elif layout == 'intermingled':
+                table_type = TableType.Intermingled
+            else:
+                table_type = TableType.RoutinesFirst
+            lib_name = f'{rng.choice(WORDS)}{page}Lib'
+            name = f'Table {page + 1}-1'
+            functions = [f'{lib_name[:-3]}_{rng.choice(WORDS)}{n}' for n in range(rng.randint(2, 8))]
+
+            lines += [_sentence(rng) for _ in range(rng.randint(3, 10))]
+            lines += [f'See {name} for the routines provided by {lib_name}.', '']
+            if table_type == TableType.RoutinesFirst:
+                lines += _routines_first_table(rng, name, functions)
+            else:
+                lines += _intermingled_table(rng, name, functions)
+            counts[table_type.value] += 1
+        lines += [_sentence(rng) for _ in range(rng.randint(2, 12))]
+        lines += ['', str(page + 100), '']
+    return '\n'.join(lines) + '\n', counts
+
+
+def long_description_table(table_type, functions=2, block_lines=1000):
+    # a single table whose function descriptions are blocks of block_lines
+    # lines each, and the PAGE_SIZE the parser needs to read all of them
+    rng = random.Random(block_lines)
+    names = [f'long_function{n}' for n in range(functions)]
+    blocks = [[_sentence(rng) for _ in range(block_lines)] for _ in names]
+    lines = ['longLib', '', 'Table 1-1', '', _title(rng), '']
+    if table_type == TableType.RoutinesFirst:
+        lines += ['Call', ''] + [f'{name}( )' for name in names] + ['Description', '']
+        for block in blocks:
+            lines += block + ['']
+    else:
+        lines += ['Routine', '', 'Description', '']
+        for name, block in zip(names, blocks):
+            lines += [f'{name}( )', ''] + block + ['']
+    lines += ['100', '']
+    return '\n'.join(lines) + '\n', blocks, len(lines)
+
+
+def bench_description_scaling(sizes=(1000, 2000, 4000, 8000), number=5):
+    # time per description line of one table with ever longer description
+    # blocks; flat numbers mean linear scaling
+    results = {}
+    print('description blocks')
+    for table_type in TableType:
+        for block_lines in sizes:
+            text, _, page_size = long_description_table(table_type, block_lines=block_lines)
+            pdf_p = PDFTextParser()
+            pdf_p.configure({'PAGE_SIZE': page_size})
+            pdf_p.parse(text)
+            seconds = min(timeit.repeat(lambda: pdf_p.process_table_at_index(0), number=1, repeat=number))
+            name = f'{table_type.name}_{block_lines}'
+            results[name] = {'seconds': seconds, 'lines': 2 * block_lines}
+            print(f'  {table_type.name:<14} {block_lines:>6} lines/block  {seconds * 1000:8.2f} ms  '
+                  f'{seconds / (2 * block_lines) * 1e9:8.1f} ns/line')
+    return results
+
+
+def _peak_rss_kb():
+    # ru_maxrss survives the exec of a spawned worker, so it can report the
+    # parent's peak; Linux has this process's own high water mark
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _run_parser(filename, reader):
+    # runs in a fresh process so peak RSS only covers the parser; rss_growth
+    # leaves out the interpreter and imports
+    base_rss_kb = _peak_rss_kb()
+    start = time.perf_counter()
+    pdf_p = PDFTextParser()
+    if reader == 'mmap':
+        pdf_p.parse_file(filename)
+    else:
+        with open(filename, 'r', encoding='ISO-8859-1') as f:
+            pdf_p.parse(f.read())
+    startup = time.perf_counter() - start
+    tables = sum(1 for _ in pdf_p.iter_tables())
+    return time.perf_counter() - start, startup, len(pdf_p.text), tables, _peak_rss_kb(), _peak_rss_kb() - base_rss_kb
+
+
+def bench_parser(filename, reader='read'):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        seconds, startup, lines, tables, peak_rss_kb, rss_growth_kb = executor.submit(_run_parser, filename,
+                                                                                      reader).result()
+    return {'seconds': seconds, 'startup_seconds': startup, 'lines': lines, 'tables': tables,
+            'lines_per_sec': lines / seconds, 'tables_per_sec': tables / seconds, 'peak_rss_kb': peak_rss_kb,
+            'rss_growth_kb': rss_growth_kb}
+
+
+def bench_table_walk(filename, number=3):
+    # iter_tables() alone on decoded str lines ('read') and on the raw bytes
+    # of a mapped file ('mmap', function rows matched without decoding),
+    # best of number walks, each on a freshly parsed text. The bytes path
+    # decodes lazily to save memory, it is not expected to beat the str one
+    results = {}
+    print('table walk')
+    for reader, path in (('read', 'str'), ('mmap', 'bytes')):
+        best = None
+        for _ in range(number):
+            pdf_p = PDFTextParser()
+            if reader == 'mmap':
+                pdf_p.parse_file(filename)
+            else:
+                with open(filename, 'r', encoding='ISO-8859-1') as f:
+                    pdf_p.parse(f.read())
+            start = time.perf_counter()
+            tables = sum(1 for _ in pdf_p.iter_tables())
+            seconds = time.perf_counter() - start
+            best = seconds if best is None else min(best, seconds)
+            if reader == 'mmap':
+                pdf_p.text.close()
+        results[path] = {'seconds': best, 'tables': tables, 'tables_per_sec': tables / best}
+        print(f'  {path:<6} {best:8.3f} s  {tables / best:10.0f} tables/s')
+    return results
+
+
+def bench_cli(filename, lines, tables, extra_args=()):
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pdf_text_scraper.py')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output = os.path.join(tmp_dir, 'tables.json')
+        start = time.perf_counter()
+        subprocess.run([sys.executable, script, '-f', filename, '-o', output, '--no-cache'] + list(extra_args),
+                       check=True)
+        seconds = time.perf_counter() - start
+        # largest child waited for so far; the CLI run is the biggest child this script starts
+        peak_rss_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return {'seconds': seconds, 'lines': lines, 'tables': tables,
+            'lines_per_sec': lines / seconds, 'tables_per_sec': tables / seconds, 'peak_rss_kb': peak_rss_kb}
+
+
+def fixture_lines(copies):
+    from test_pdf_text_scraper import example_text_table_1, example_text_table_2
+    return [line.strip() for line in ((example_text_table_1 + example_text_table_2) * copies).split('\n')]
+
+
+def bench_line_classification(copies=50, number=20):
+    # Asks the same questions of every fixture line (table heading? page
+    # number? function row? lib name?) once the way the parser used to, with
+    # re.match() on pattern strings and ' ' + line copies, and once with the
+    # precompiled classifier. The "reread" rows ask them a second time, which
+    # is what overlapping table windows do.
+    lines = fixture_lines(copies)
+    pdf_p = PDFTextParser()
+    regex_libname = r'.*\s(?P<lib_name>\w+Lib)'
+
+    def per_call():
+        for line in lines:
+            line.startswith('Table') and 1 == line.count('Table') and '.' not in line
+            re.match(pdf_p.regex_page_number, line)
+            re.match(pdf_p.regex_function, line)
+            re.match(regex_libname, ' ' + line)
+
+    def classified():
+        pdf_p.text = lines
+        pdf_p.build_index()
+        libname_match = pdf_p.classifier.libname.match
+        for i in range(len(lines)):
+            pdf_p.line_flags[i] & (LINE_TABLE | LINE_PAGE_NUMBER)
+            pdf_p._function_at(i)
+            libname_match(lines[i])
+
+    def reread():
+        for i in range(len(lines)):
+            pdf_p.line_flags[i] & (LINE_TABLE | LINE_PAGE_NUMBER)
+            pdf_p._function_at(i)
+
+    results = [('re.match(pattern string)', timeit.timeit(per_call, number=number)),
+               ('LineClassifier', timeit.timeit(classified, number=number))]
+    per_call_reread = timeit.timeit(per_call, number=number)
+    classified()
+    results.append(('reread, re.match(pattern string)', per_call_reread))
+    results.append(('reread, cached line flags', timeit.timeit(reread, number=number)))
+
+    print(f'line classification, {len(lines)} lines x {number}')
+    for name, seconds in results:
+        print(f'  {name:<36} {seconds / number * 1000:8.2f} ms/pass  {len(lines) * number / seconds:12.0f} lines/s')
+    return {name: len(lines) * number / seconds for name, seconds in results}
+
+
+def _dict_merge(library_dict, idx, table_info):
+    # the dict based merge used before TableInfo/LibraryTable, kept for comparison
+    tbl_name = table_info['tbl_name'] or 'UnKnown'
+    if tbl_name not in library_dict:
+        library_dict[tbl_name] = {'table_name': table_info['tbl_name'], 'lib_name': None,
+                                  'description': table_info['tbl_description'], 'functions': []}
+    if library_dict[tbl_name]['lib_name'] is None or 'lib_at' in library_dict[tbl_name]['lib_name']:
+        library_dict[tbl_name]['lib_name'] = table_info['lib_name'] or f'lib_at_{str(idx)}'
+    for i in range(len(table_info['functions'])):
+        item = {'name': table_info['functions'][i], 'description': table_info['descriptions'][i]}
+        library_dict[tbl_name]['functions'].append(item)
+
+
+def bench_record_memory(text):
+    # memory held by the per-table records and the merged output, both
+    # representations built from the same parsed strings
+    pdf_p = PDFTextParser()
+    pdf_p.parse(text)
+    records = list(pdf_p.iter_tables())
+
+    def dict_path():
+        tables = [(idx, {'tbl_name': t.tbl_name, 'tbl_description': t.tbl_description, 'lib_name': t.lib_name,
+                         'type': t.type, 'functions': list(t.functions), 'descriptions': list(t.descriptions)})
+                  for idx, t in records]
+        library_dict = OrderedDict()
+        for idx, table_info in tables:
+            _dict_merge(library_dict, idx, table_info)
+        return tables, library_dict
+
+    def slotted_path():
+        tables = [(idx, TableInfo(t.tbl_name, t.tbl_description, t.lib_name, t.type, list(t.functions),
+                                  list(t.descriptions)))
+                  for idx, t in records]
+        library_dict = OrderedDict()
+        for idx, table_info in tables:
+            merge_table_info(library_dict, idx, table_info)
+        return tables, library_dict
+
+    results = {}
+    functions = sum(len(t.functions) for _, t in records)
+    print(f'record memory, {len(records)} tables, {functions} functions')
+    for name, build in (('dicts', dict_path), ('slots', slotted_path)):
+        tracemalloc.start()
+        built = build()
+        size, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del built
+        results[name] = {'bytes': size, 'peak_bytes': peak}
+        print(f'  {name:<8} {size / 1024:10.1f} KB held  {peak / 1024:10.1f} KB peak  '
+              f'{size / max(functions, 1):8.1f} bytes/function')
+    return results
+
+
+def print_result(name, result):
+    print(f'{name:<8} {result["lines"]:>10} lines {result["tables"]:>7} tables  {result["seconds"]:8.3f} s  '
+          f'{result["lines_per_sec"]:12.0f} lines/s  {result["tables_per_sec"]:10.0f} tables/s  '
+          f'peak RSS {result["peak_rss_kb"] / 1024:8.1f} MB'
+          + (f' (+{result["rss_growth_kb"] / 1024:.1f} MB parsing)' if 'rss_growth_kb' in result else '')
+          + (f'  index built in {result["startup_seconds"]:.3f} s' if 'startup_seconds' in result else ''))
+
+
+def _throughput(result):
+    # items per second of one measurement, None for untimed ones (record_memory)
+    if isinstance(result, (int, float)):
+        # classification rows are lines/s already
+        return result
+    for key in ('lines_per_sec', 'tables_per_sec'):
+        if key in result:
+            return result[key]
+    if 'lines' in result and 'seconds' in result:
+        return result['lines'] / result['seconds']
+    return None
+
+
+def throughputs(results):
+    # {name: items per second} of every timed measurement in results, the
+    # rows of grouped benchmarks (classification, table_walk,
+    # description_blocks) named group/row
+    measurements = {}
+    for name, result in results.items():
+        throughput = _throughput(result)
+        if throughput is not None:
+            measurements[name] = throughput
+            continue
+        for row, row_result in result.items():
+            if isinstance(row_result, (dict, int, float)):
+                throughput = _throughput(row_result)
+                if throughput is not None:
+                    measurements[f'{name}/{row}'] = throughput
+    return measurements
+
+
+def check_memory(results):
+    # --mmap is there to keep memory down, what parsing adds to the peak RSS
+    # has to stay below the read path's
+    if 'mmap' in results and 'parser' in results:
+        if results['mmap']['rss_growth_kb'] >= results['parser']['rss_growth_kb']:
+            return ['mmap rss_growth_kb']
+    return []
+
+
+def check_baseline(results, baseline, tolerance):
+    # names of measurements whose throughput dropped more than tolerance below the baseline
+    baseline = throughputs(baseline)
+    return [name for name, throughput in throughputs(results).items()
+            if name in baseline and throughput < baseline[name] * (1 - tolerance)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='benchmark pdf_text_scraper hot paths')
+    parser.add_argument('--pages', type=int, default=2000, help='pages in the synthetic manual')
+    parser.add_argument('--tables', type=int, default=2000, help='tables in the synthetic manual, at most one per page')
+    parser.add_argument('--layout', choices=('mixed', 'routines-first', 'intermingled'), default='mixed',
+                        help='TableType layout of the synthetic tables')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of the synthetic manual')
+    parser.add_argument('--skip-cli', action='store_true', help='only benchmark the parser, not the full CLI')
+    parser.add_argument('--copies', type=int, default=50, help='copies of the test fixture text to classify')
+    parser.add_argument('--number', type=int, default=20, help='timed passes of the classification benchmark')
+    parser.add_argument('--json', help='also write the results to this json file')
+    parser.add_argument('--baseline', help='json results of an earlier run, exit non-zero on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed relative throughput drop against --baseline (default: 0.2)')
+    args = parser.parse_args()
+
+    results = {'classification': bench_line_classification(args.copies, args.number)}
+    results['description_blocks'] = bench_description_scaling()
+
+    text, counts = generate_manual(args.pages, args.tables, args.layout, args.seed)
+    print(f'synthetic manual: {args.pages} pages, {counts[TableType.RoutinesFirst.value]} RoutinesFirst and '
+          f'{counts[TableType.Intermingled.value]} Intermingled tables, {len(text) / 1024 / 1024:.1f} MB')
+    results['record_memory'] = bench_record_memory(text)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, 'manual.txt')
+        with open(filename, 'w', encoding='ISO-8859-1') as f:
+            f.write(text)
+
+        results['parser'] = bench_parser(filename)
+        print_result('parser', results['parser'])
+        results['mmap'] = bench_parser(filename, 'mmap')
+        print_result('mmap', results['mmap'])
+        results['table_walk'] = bench_table_walk(filename)
+        if not args.skip_cli:
+            results['cli'] = bench_cli(filename, results['parser']['lines'], results['parser']['tables'])
+            print_result('cli', results['cli'])
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            f.write(json.dumps(results, sort_keys=True, indent=2))
+
+    regressions = check_memory(results)
+    if regressions:
+        print('parsing with mmap does not grow the peak RSS less than the read path')
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            throughput_regressions = check_baseline(results, json.load(f), args.tolerance)
+        if throughput_regressions:
+            print(f'throughput regressions against {args.baseline}: {", ".join(throughput_regressions)}')
+        regressions += throughput_regressions
+    if regressions:
+        sys.exit(1)
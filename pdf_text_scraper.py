@@ -1,10 +1,55 @@
 #!/usr/bin/env python3
 import argparse
+import bisect
+from array import array
+import bz2
+import difflib
+import gzip
+import hashlib
+import heapq
+import io
 import json
+import lzma
+import mmap
+import os
 import re
+import signal
+import sqlite3
+import sys
+import tempfile
+import time
 from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from functools import partial
 from enum import Enum
-from pprint import pprint
+
+try:
+    from pdfminer.converter import TextConverter
+    from pdfminer.layout import LAParams
+    from pdfminer.pdfdocument import PDFDocument
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    from pdfminer.pdfpage import PDFPage
+    from pdfminer.pdfparser import PDFParser
+    from pdfminer.pdftypes import resolve1
+except ImportError:
+    PDFPage = None
+
+# NumPy is only needed to index memory maps, load_numpy() imports it on first use
+NOT_LOADED = object()
+np = NOT_LOADED
+
+
+def load_numpy():
+    # returns None when NumPy isn't installed, the line index is then built
+    # with a Python loop over the lines
+    global np
+    if np is NOT_LOADED:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        np = numpy
+    return np
 
 
 class TableType(Enum):
@@ -12,131 +57,819 @@ class TableType(Enum):
     Intermingled = 2
 
 
-class PDFTextParser(object):
+class FunctionEntry(object):
+    __slots__ = ('name', 'description')
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+
+    def as_dict(self):
+        return {'name': self.name, 'description': self.description}
+
+    def __eq__(self, other):
+        if isinstance(other, FunctionEntry):
+            return (self.name, self.description) == (other.name, other.description)
+        return NotImplemented
+
+    def __repr__(self):
+        return f'FunctionEntry({self.name!r}, {self.description!r})'
+
+
+class TableInfo(object):
+    # One parsed table. functions and descriptions are parallel lists while
+    # the table is parsed, entries() pairs them up. Item access and equality
+    # with plain dicts keep the old dict based interface working.
+    __slots__ = ('tbl_name', 'tbl_description', 'lib_name', 'type', 'functions', 'descriptions')
+
+    def __init__(self, tbl_name=None, tbl_description=None, lib_name=None, type=None, functions=None,
+                 descriptions=None):
+        self.tbl_name = tbl_name
+        self.tbl_description = tbl_description
+        self.lib_name = lib_name
+        self.type = type
+        self.functions = [] if functions is None else functions
+        self.descriptions = [] if descriptions is None else descriptions
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(**d)
+
+    def entries(self):
+        return [FunctionEntry(self.functions[i], self.descriptions[i]) for i in range(len(self.functions))]
+
+    def __eq__(self, other):
+        if isinstance(other, TableInfo):
+            return self.as_dict() == other.as_dict()
+        if isinstance(other, dict):
+            return self.as_dict() == other
+        return NotImplemented
+
+    def __repr__(self):
+        return f'TableInfo({self.as_dict()!r})'
+
+
+class TableError(object):
+    # a table that failed to parse: the file and heading line it sits at and why
+    __slots__ = ('file', 'line', 'reason')
+
+    def __init__(self, file, line, reason):
+        self.file = file
+        self.line = line
+        self.reason = reason
+
+    def as_dict(self):
+        return {'file': self.file, 'line': self.line, 'reason': self.reason}
+
+    def __eq__(self, other):
+        if isinstance(other, TableError):
+            return self.as_dict() == other.as_dict()
+        return NotImplemented
+
+    def __repr__(self):
+        return f'TableError({self.file!r}, {self.line!r}, {self.reason!r})'
+
+
+class MergeConflict(object):
+    # two occurrences of a merged table that disagree on field: the table's
+    # lib_name, or the description of function name; the kept value wins
+    __slots__ = ('table_name', 'name', 'field', 'kept', 'dropped')
+
+    def __init__(self, table_name, name, field, kept, dropped):
+        self.table_name = table_name
+        self.name = name
+        self.field = field
+        self.kept = kept
+        self.dropped = dropped
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __eq__(self, other):
+        if isinstance(other, MergeConflict):
+            return self.as_dict() == other.as_dict()
+        return NotImplemented
+
+    def __repr__(self):
+        return f'MergeConflict({self.table_name!r}, {self.name!r}, {self.field!r}, {self.kept!r}, {self.dropped!r})'
+
+
+class LibraryTable(object):
+    # A table of the merged output, all occurrences of one table name.
+    # entry_index maps (lib name, function name) to the merged FunctionEntry,
+    # so repeated occurrences add no duplicates.
+    # lib_placeholder is set while lib_name is only the lib_at_N stand-in.
+    __slots__ = ('table_name', 'lib_name', 'description', 'functions', 'lib_placeholder', 'entry_index')
+
+    def __init__(self, table_name, lib_name, description, functions=None):
+        self.table_name = table_name
+        self.lib_name = lib_name
+        self.description = description
+        self.functions = [] if functions is None else functions
+        self.lib_placeholder = False
+        self.entry_index = {}
+
+    def as_dict(self):
+        return {'table_name': self.table_name, 'lib_name': self.lib_name, 'description': self.description,
+                'functions': [entry.as_dict() for entry in self.functions]}
+
+
+def _json_default(o):
+    return o.as_dict()
+
+
+# what str.strip() removes from ISO-8859-1 text
+STRIPPED_BYTES = b' \t\r\x0b\x0c\x1c\x1d\x1e\x1f\x85\xa0'
+# bytes str and bytes patterns treat differently: str patterns count
+# \x1c-\x1f as whitespace and match non-ASCII letters with \w
+NON_ASCII_BYTES = re.compile(rb'[\x1c-\x1f\x80-\xff]')
+
+# per line classification flags, see LineClassifier
+LINE_BLANK = 0x01
+LINE_TABLE = 0x02
+LINE_MARKER = 0x04
+LINE_DESCRIPTION = 0x08
+LINE_PAGE_NUMBER = 0x10
+LINE_FUNCTION = 0x20
+LINE_FUNCTION_CHECKED = 0x40
+LINE_STRUCTURE = LINE_TABLE | LINE_MARKER | LINE_DESCRIPTION | LINE_PAGE_NUMBER
+
+
+class LineClassifier(object):
+    # All patterns of one parser configuration, compiled once and shared by
+    # every parser using that configuration. The structural kinds of a line
+    # (blank, table heading, Routine/Call marker, Description header, page
+    # number) are mutually exclusive and come from a single combined regex.
+    _compiled = {}
+
+    STRUCTURE_FLAGS = {'blank': LINE_BLANK, 'table': LINE_TABLE, 'marker': LINE_MARKER,
+                       'description': LINE_DESCRIPTION, 'page_number': LINE_PAGE_NUMBER}
+    # ^ and $ outside of character classes
+    ANCHORS = re.compile(r'(?<![\\\[])\^|(?<!\\)\$')
+
+    def __init__(self, regex_libname, regex_function, regex_page_number, regex_table_name, table_heading,
+                 regex_table_marker, description_header):
+        self.libname = re.compile(regex_libname)
+        self.function = re.compile(regex_function)
+        # for the raw lines of a MappedText, see MappedText.ascii_line()
+        self.function_bytes = re.compile(regex_function.encode('latin-1'))
+        self.libname_bytes = re.compile(regex_libname.encode('latin-1'))
+        self.page_number = re.compile(regex_page_number)
+        self.table_name = re.compile(regex_table_name)
+        page_number = regex_page_number[1:] if regex_page_number.startswith('^') else regex_page_number
+        heading = re.escape(table_heading)
+        description = re.escape(description_header)
+        self.structure = re.compile(r'(?P<blank>$)'
+                                    r'|(?P<table>' + heading + r'(?!.*' + heading + r')[^.]*$)'
+                                    r'|(?P<marker>' + regex_table_marker + r')'
+                                    r'|(?P<description>' + description + r'$)'
+                                    r'|(?P<page_number>' + page_number + ')')
+        # the non blank kinds without group names, to be combined with other layouts'
+        self.structure_source = (heading + r'(?!.*' + heading + r')[^.]*$'
+                                 r'|' + regex_table_marker +
+                                 r'|' + description + r'$'
+                                 r'|' + page_number)
+        # The same kinds for the raw, unstripped lines of an ISO-8859-1 buffer,
+        # matched from the newline in front of the line. It finds candidate
+        # lines without decoding the others, so it must match every line the
+        # str pattern matches: the whitespace class is what str.strip()
+        # removes. Group 1 is empty for blank lines, other candidates are
+        # checked against the str pattern once decoded.
+        # structure_candidates is the same without blank lines. The layout's
+        # own marker and page number patterns lose their anchors and may be
+        # followed by anything, which only lets more lines through.
+        heading = heading.encode('latin-1')
+        marker = self.ANCHORS.sub('', regex_table_marker).encode('latin-1')
+        page_number = self.ANCHORS.sub('', regex_page_number).encode('latin-1')
+        self.candidate_source = (heading + rb'(?![^\r\n]*' + heading + rb')[^.\r\n]*?'
+                                 rb'|(?:' + marker + rb')[^\r\n]*?'
+                                 rb'|' + description.encode('latin-1') +
+                                 rb'|(?:' + page_number + rb')[^\r\n]*?')
+        self.structure_bytes, self.structure_candidates = self.bytes_patterns([self.candidate_source])
+
+    @staticmethod
+    def bytes_patterns(candidate_sources):
+        # (structure_bytes, structure_candidates) for lines any of several
+        # layouts' candidate_sources matches, so one scan serves them all
+        ws = b'[' + re.escape(STRIPPED_BYTES) + b']*'
+        candidate = b'|'.join(b'(?:' + source + b')' for source in candidate_sources)
+        return (re.compile(rb'\n' + ws + rb'(' + candidate + rb')?' + ws + rb'(?=\n|\Z)'),
+                re.compile(rb'\n' + ws + rb'(?:' + candidate + rb')' + ws + rb'(?=\n|\Z)'))
+
+    @classmethod
+    def for_parser(cls, parser):
+        key = (parser.regex_libname, parser.regex_function, parser.regex_page_number, parser.regex_table_name,
+               parser.table_heading, parser.regex_table_marker, parser.description_header)
+        classifier = cls._compiled.get(key)
+        if classifier is None:
+            classifier = cls._compiled[key] = cls(*key)
+        return classifier
+
+    def classify(self, line):
+        m = self.structure.match(line)
+        if m:
+            return self.STRUCTURE_FLAGS[m.lastgroup]
+        return 0
+
+
+def bulk_structure_lines(text, classifier):
+    # NumPy version of the line classification of a MappedText. Returns the
+    # blank line numbers as an array and the other structural lines as sorted
+    # (line number, flag) pairs. Blank lines are found with array operations
+    # and other candidates with one regex scan, so only those candidates are
+    # decoded and checked instead of every line going through a Python loop.
+    blank, candidates = bulk_candidate_lines(text, classifier.structure_candidates)
+    structure_match = classifier.structure.match
+    structure_flags = classifier.STRUCTURE_FLAGS
+    structural = []
+    for i in candidates:
+        m = structure_match(text[i])
+        if m and m.lastgroup != 'blank':
+            structural.append((i, structure_flags[m.lastgroup]))
+    return blank, structural
+
+
+def bulk_candidate_lines(text, structure_candidates):
+    # blank line numbers of a MappedText as an array, and the sorted numbers
+    # of the other lines structure_candidates (see LineClassifier) finds.
+    # Arrays are per line, the buffer itself is only viewed, never copied
+    buf = text.buf
+    starts = np.frombuffer(text.starts, np.uint64).astype(np.int64)
+    ends = np.append(starts[1:] - 1, len(buf))
+    blank = starts == ends
+    # lines of only whitespace start with a whitespace byte
+    whitespace = np.zeros(256, dtype=bool)
+    whitespace[list(STRIPPED_BYTES)] = True
+    nonempty = np.flatnonzero(~blank)
+    for i in nonempty[whitespace[np.frombuffer(buf, np.uint8)[starts[nonempty]]]].tolist():
+        if not text[i]:
+            blank[i] = True
+
+    positions = np.fromiter((m.start() for m in structure_candidates.finditer(buf)), dtype=np.int64)
+    # a match starts at the newline in front of its line
+    candidates = np.searchsorted(starts, positions, side='right')
+    if not blank[0]:
+        candidates = np.concatenate(([0], candidates))
+    return np.flatnonzero(blank), candidates.tolist()
+
+
+class MappedText(object):
+    # Read only sequence of the lines of a memory mapped text file. Only line
+    # offsets are kept; a line is decoded and stripped, exactly like the str
+    # lines parse() makes, when it is indexed.
+
+    # bytes NumPy looks at in one go, which bounds its temporary arrays
+    CHUNK_SIZE = 8 * 1024 * 1024
+
+    def __init__(self, filename, encoding='ISO-8859-1'):
+        self.encoding = encoding
+        with open(filename, 'rb') as f:
+            try:
+                self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # empty files can't be mapped
+                self.buf = b''
+        if re.search(rb'\r(?!\n)', self.buf):
+            # text mode reads would treat a lone CR as a line break, we only split on LF
+            raise ValueError(f'{filename} has CR line breaks, read it without mmap')
+        self._ascii_lines = None
+        # line i is buf[starts[i]:starts[i + 1] - 1], the last one runs to the end
+        self.starts = array('Q', [0])
+        if load_numpy() is not None:
+            for offset in range(0, len(self.buf), self.CHUNK_SIZE):
+                chunk = np.frombuffer(self.buf, np.uint8, min(self.CHUNK_SIZE, len(self.buf) - offset), offset)
+                self.starts.frombytes((np.flatnonzero(chunk == 10) + (offset + 1)).astype('u8').tobytes())
+        else:
+            self.starts.extend(m.end() for m in re.finditer(b'\n', self.buf))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1 or start >= stop:
+                return [self[j] for j in range(start, stop, step)]
+            # one decode for the whole run of lines
+            end = self.starts[stop] - 1 if stop < len(self.starts) else len(self.buf)
+            return [line.strip() for line in self.buf[self.starts[start]:end].decode(self.encoding).split('\n')]
+        start = self.starts[i]
+        end = self.starts[i + 1] - 1 if i + 1 < len(self.starts) and i != -1 else len(self.buf)
+        return self.buf[start:end].decode(self.encoding).strip()
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def ascii_line(self, i):
+        # Line i stripped but not decoded, or None when it has bytes that
+        # str and bytes patterns treat differently. A bytes pattern then
+        # matches it as its str pattern matches self[i], and the ASCII text it
+        # captures is already what sanitize_string() would make of it.
+        if self._ascii_lines is None:
+            self._ascii_lines = self._find_ascii_lines()
+        if not self._ascii_lines[i]:
+            return None
+        start = self.starts[i]
+        end = self.starts[i + 1] - 1 if i + 1 < len(self.starts) else len(self.buf)
+        return self.buf[start:end].strip(STRIPPED_BYTES)
+
+    def _find_ascii_lines(self):
+        # one pass over the buffer for the lines without NON_ASCII_BYTES
+        ascii_lines = bytearray(b'\x01') * len(self.starts)
+        if load_numpy() is not None:
+            non_ascii = np.zeros(256, dtype=bool)
+            non_ascii[0x80:] = True
+            non_ascii[0x1c:0x20] = True
+            starts = np.frombuffer(self.starts, np.uint64).astype(np.int64)
+            flags = np.frombuffer(ascii_lines, np.uint8)
+            for offset in range(0, len(self.buf), self.CHUNK_SIZE):
+                chunk = np.frombuffer(self.buf, np.uint8, min(self.CHUNK_SIZE, len(self.buf) - offset), offset)
+                positions = np.flatnonzero(non_ascii[chunk]) + offset
+                flags[np.searchsorted(starts, positions, side='right') - 1] = 0
+            return ascii_lines
+        for m in NON_ASCII_BYTES.finditer(self.buf):
+            ascii_lines[bisect.bisect_right(self.starts, m.start()) - 1] = 0
+        return ascii_lines
+
+    def structure_lines(self, classifier):
+        # (line number, flag) of the structural lines, found with one regex
+        # pass over the raw buffer; only non blank candidates are decoded
+        for i, line in self.candidate_lines(classifier.structure_bytes):
+            if line is None:
+                yield i, LINE_BLANK
+                continue
+            m = classifier.structure.match(line)
+            if m:
+                yield i, classifier.STRUCTURE_FLAGS[m.lastgroup]
+
+    def candidate_lines(self, structure_bytes):
+        # (line number, line) of the first line and of the lines
+        # structure_bytes (see LineClassifier) finds, line None when blank
+        yield 0, self[0]
+        i = 0
+        prev = 0
+        for m in structure_bytes.finditer(self.buf):
+            pos = m.start() + 1
+            i += self.buf[prev:pos].count(b'\n')
+            prev = pos
+            yield i, None if m.group(1) is None else self[i]
+
+    def close(self):
+        if isinstance(self.buf, mmap.mmap):
+            self.buf.close()
+
+
+class ParserStats(object):
+    # Counters and cumulative seconds per phase of the parsers it is handed
+    # to. parse covers splitting and indexing lines, output the merging and
+    # writing of records. Phases don't overlap, so they add up to the time
+    # the parsers and writers took.
+    PHASES = ('parse', 'find_next_table_idx', 'process_table_at_index', 'output')
+
     def __init__(self):
+        self.lines_scanned = 0
+        self.regex_evaluations = 0
+        self.tables = {table_type.name: 0 for table_type in TableType}
+        self.tables_skipped = 0
+        self.seconds = {phase: 0.0 for phase in self.PHASES}
+
+    def timed(self, phase, func):
+        # func, adding the time each call takes to phase
+        def timed_func(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.seconds[phase] += time.perf_counter() - start
+        return timed_func
+
+    def merge(self, other):
+        self.lines_scanned += other.lines_scanned
+        self.regex_evaluations += other.regex_evaluations
+        for name, count in other.tables.items():
+            self.tables[name] += count
+        self.tables_skipped += other.tables_skipped
+        for phase, seconds in other.seconds.items():
+            self.seconds[phase] += seconds
+
+    def as_dict(self):
+        return {'lines_scanned': self.lines_scanned, 'regex_evaluations': self.regex_evaluations,
+                'tables': dict(self.tables), 'tables_skipped': self.tables_skipped, 'seconds': dict(self.seconds)}
+
+
+class PDFTextParser(object):
+    def __init__(self, stats=None, errors=None):
         self.text = []
         self.idx = 0
+        # a ParserStats to count into, None keeps the hot paths free of bookkeeping
+        self.stats = stats
+        # a list to append a TableError to for each table that fails to
+        # parse, which is then skipped; None lets the exception through
+        self.errors = errors
+
+        # line index built by parse(), LINE_* flags per line and sorted lists of line numbers
+        self.line_flags = bytearray()
+        self.table_lines = []
+        self.marker_lines = []
+        self.description_lines = []
+        self.page_number_lines = []
+        self.blank_lines = []
 
         self.PAGE_SIZE = 100
         self.TABLE_TYPE_RANGE = 10
         self.TABLE_HEADING_RANGE = 30
         self.SEARCH_BACKWARD_RANGE = 6
 
-        self.regex_libname = r'.*\s(?P<lib_name>\w+Lib)'
+        self.regex_libname = r'^(?:.*\s)?(?P<lib_name>\w+Lib)'
         self.regex_function = r'^(?P<function_name>\w+)\(\s*\)\s*(?P<description>.*)'
         self.regex_page_number = r'^\d\d\d+$'
+        self.regex_table_name = r'^(?P<tbl_name>Table\s+[\w+\d+]+.\d+)\s*?(?P<tbl_description>.*)'
+        # structural lines: table headings start with table_heading, the
+        # routine list is introduced by a regex_table_marker line and the
+        # descriptions by a description_header line
+        self.table_heading = 'Table'
+        self.regex_table_marker = r'Routine|Call'
+        self.description_header = 'Description'
+        self.classifier = LineClassifier.for_parser(self)
+
+    CONFIG_FIELDS = ('PAGE_SIZE', 'TABLE_TYPE_RANGE', 'TABLE_HEADING_RANGE', 'SEARCH_BACKWARD_RANGE',
+                     'regex_libname', 'regex_function', 'regex_page_number', 'regex_table_name',
+                     'table_heading', 'regex_table_marker', 'description_header')
+
+    def config(self):
+        return {name: getattr(self, name) for name in self.CONFIG_FIELDS}
+
+    def configure(self, config):
+        for name in self.CONFIG_FIELDS:
+            if name in config:
+                setattr(self, name, config[name])
+        self.classifier = LineClassifier.for_parser(self)
 
     def parse(self, text_chunk):
+        start = time.perf_counter()
         self.text = text_chunk.split('\n')
         for i in range(len(self.text)):
             self.text[i] = self.text[i].strip()
+        self.build_index()
+        if self.stats is not None:
+            self.stats.seconds['parse'] += time.perf_counter() - start
 
-    def find_next_table_idx(self):
-        try:
-            for i in range(self.idx, len(self.text)):
-                line = self.text[i]
-                if line.startswith('Table') and 1 == line.count('Table'):
-                    if '.' in line:
-                        continue
-                    return i
-        except:
-            pass
+    def parse_file(self, filename):
+        # like parse(f.read()) but lines are read from a memory map on demand
+        start = time.perf_counter()
+        self.text = MappedText(filename)
+        self.build_index()
+        if self.stats is not None:
+            self.stats.seconds['parse'] += time.perf_counter() - start
+
+    def build_index(self):
+        # Single pass over the stripped lines classifying each one, so the
+        # table walk reads flags and bisects instead of rescanning self.text.
+        # Function rows are only classified when a table loop first looks at them.
+        indexes = self._new_index()
+        line_flags = self.line_flags
+        if self.stats is not None:
+            self.stats.lines_scanned += len(self.text)
+        if isinstance(self.text, MappedText) and load_numpy() is not None:
+            blank, structural = bulk_structure_lines(self.text, self.classifier)
+            np.frombuffer(line_flags, np.uint8)[blank] = LINE_BLANK
+            indexes[LINE_BLANK].extend(blank.tolist())
+            for i, flag in structural:
+                line_flags[i] = flag
+                indexes[flag].append(i)
+            if self.stats is not None:
+                # one scan of the buffer, plus the str match of each structural line it found
+                self.stats.regex_evaluations += 1 + len(structural)
+            return
+
+        if isinstance(self.text, MappedText):
+            for i, flag in self.text.structure_lines(self.classifier):
+                line_flags[i] = flag
+                indexes[flag].append(i)
+            if self.stats is not None:
+                # one scan of the buffer, plus the str match of each structural line it found
+                self.stats.regex_evaluations += 1 + len(self.text) - line_flags.count(0) - len(self.blank_lines)
+            return
+
+        structure_match = self.classifier.structure.match
+        structure_flags = self.classifier.STRUCTURE_FLAGS
+        for i, line in enumerate(self.text):
+            m = structure_match(line)
+            if m:
+                flag = structure_flags[m.lastgroup]
+                line_flags[i] = flag
+                indexes[flag].append(i)
+        if self.stats is not None:
+            self.stats.regex_evaluations += len(self.text)
+
+    def _new_index(self):
+        # empty line index for self.text, returned as {LINE_* flag: its line list}
+        self.classifier = LineClassifier.for_parser(self)
+        self.line_flags = bytearray(len(self.text))
+        self.table_lines = []
+        self.marker_lines = []
+        self.description_lines = []
+        self.page_number_lines = []
+        self.blank_lines = []
+        return {LINE_BLANK: self.blank_lines, LINE_TABLE: self.table_lines, LINE_MARKER: self.marker_lines,
+                LINE_DESCRIPTION: self.description_lines, LINE_PAGE_NUMBER: self.page_number_lines}
+
+    @staticmethod
+    def build_layout_indexes(parsers):
+        # build_index() for parsers that share one text but not their layout
+        # settings. The lines are walked once, matching each distinct
+        # structure pattern against every line (or, for a memory map, against
+        # the candidate lines one scan of the buffer finds for all of them),
+        # and parsers with the same structure pattern share the line lists.
+        # Line flags are copied, as function rows are classified with each
+        # parser's own regex.
+        groups = OrderedDict()
+        for pdf_p in parsers:
+            pdf_p.classifier = LineClassifier.for_parser(pdf_p)
+            groups.setdefault(pdf_p.classifier.structure.pattern, []).append(pdf_p)
+        leaders = [group[0] for group in groups.values()]
+        text = leaders[0].text
+        structure_flags = LineClassifier.STRUCTURE_FLAGS
+        stats = leaders[0].stats
+        if len(leaders) == 1:
+            leaders[0].build_index()
+        elif isinstance(text, MappedText):
+            # the bytes patterns of all the layouts in one scan, then each
+            # layout's str pattern on the decoded candidates
+            structure_bytes, structure_candidates = LineClassifier.bytes_patterns(
+                [leader.classifier.candidate_source for leader in leaders])
+            matchers = [(leader.classifier.structure.match, leader._new_index(), leader.line_flags)
+                        for leader in leaders]
+            if load_numpy() is not None:
+                blank, candidates = bulk_candidate_lines(text, structure_candidates)
+                for _, indexes, line_flags in matchers:
+                    np.frombuffer(line_flags, np.uint8)[blank] = LINE_BLANK
+                    indexes[LINE_BLANK].extend(blank.tolist())
+                lines = ((i, text[i]) for i in candidates)
+            else:
+                lines = text.candidate_lines(structure_bytes)
+            evaluations = 1
+            for i, line in lines:
+                if line is None:
+                    for _, indexes, line_flags in matchers:
+                        line_flags[i] = LINE_BLANK
+                        indexes[LINE_BLANK].append(i)
+                    continue
+                for structure_match, indexes, line_flags in matchers:
+                    m = structure_match(line)
+                    if m:
+                        flag = structure_flags[m.lastgroup]
+                        line_flags[i] = flag
+                        indexes[flag].append(i)
+                evaluations += len(matchers)
+            if stats is not None:
+                stats.lines_scanned += len(text)
+                stats.regex_evaluations += evaluations
+        else:
+            # Blank lines are blank in every layout, and most other lines
+            # are prose no layout cares about, which one regex of all the
+            # layouts' patterns rules out before any layout's own is tried
+            any_match = re.compile('|'.join(f'(?:{leader.classifier.structure_source})' for leader in leaders)).match
+            matchers = [(leader.classifier.structure.match, leader._new_index(), leader.line_flags)
+                        for leader in leaders]
+            blank_lines = [indexes[LINE_BLANK] for _, indexes, _ in matchers]
+            for i, line in enumerate(text):
+                if not line:
+                    for lines in blank_lines:
+                        lines.append(i)
+                    continue
+                if not any_match(line):
+                    continue
+                for structure_match, indexes, line_flags in matchers:
+                    m = structure_match(line)
+                    if m:
+                        flag = structure_flags[m.lastgroup]
+                        line_flags[i] = flag
+                        indexes[flag].append(i)
+            for leader in leaders:
+                for i in leader.blank_lines:
+                    leader.line_flags[i] = LINE_BLANK
+            if stats is not None:
+                stats.lines_scanned += len(text)
+                stats.regex_evaluations += len(text) * len(leaders)
+
+        for leader, *followers in groups.values():
+            for pdf_p in followers:
+                pdf_p.line_flags = bytearray(leader.line_flags)
+                pdf_p.table_lines = leader.table_lines
+                pdf_p.marker_lines = leader.marker_lines
+                pdf_p.description_lines = leader.description_lines
+                pdf_p.page_number_lines = leader.page_number_lines
+                pdf_p.blank_lines = leader.blank_lines
+
+    @classmethod
+    def parse_layouts(cls, text, configs, stats=None, errors=None):
+        # parse() with one parser per layout config, text (or a MappedText)
+        # is split into stripped lines once and shared by all of them
+        start = time.perf_counter()
+        if not isinstance(text, MappedText):
+            text = [line.strip() for line in text.split('\n')]
+        parsers = []
+        for config in configs:
+            pdf_p = cls(stats, errors)
+            pdf_p.configure(config)
+            pdf_p.text = text
+            parsers.append(pdf_p)
+        cls.build_layout_indexes(parsers)
+        if stats is not None:
+            stats.seconds['parse'] += time.perf_counter() - start
+        return parsers
+
+    def _timed_build_index(self):
+        start = time.perf_counter()
+        self.build_index()
+        if self.stats is not None:
+            self.stats.seconds['parse'] += time.perf_counter() - start
+
+    @staticmethod
+    def _next_in(index, start, end=None):
+        # first indexed line number in [start, end), or None
+        pos = bisect.bisect_left(index, start)
+        if pos < len(index) and (end is None or index[pos] < end):
+            return index[pos]
         return None
 
+    def _window(self, start, size):
+        # line numbers of the size lines from start, clamped to the end of the text
+        return range(start, min(start + size, len(self.text)))
+
+    def _line(self, i):
+        # line i, or '' past the end of the text
+        return self.text[i] if i < len(self.text) else ''
+
+    def find_next_table_idx(self):
+        if self.stats is None:
+            return self._next_in(self.table_lines, self.idx)
+        start = time.perf_counter()
+        idx = self._next_in(self.table_lines, self.idx)
+        self.stats.seconds['find_next_table_idx'] += time.perf_counter() - start
+        return idx
+
     def search_libname_in_range(self, start, end):
         lib_name = None
+        libname_match = self.classifier.libname.match
+        libname_bytes_match = self.classifier.libname_bytes.match
+        mapped = isinstance(self.text, MappedText)
         for i in range(end, start, -1):
-            m = re.match(self.regex_libname, ' ' + self.text[i])
-            if m:
-                lib_name = m.groupdict()['lib_name']
-                break
+            line = self.text.ascii_line(i) if mapped else None
+            if line is None:
+                m = libname_match(self.text[i])
+                if m:
+                    lib_name = sys.intern(m['lib_name'])
+                    break
+            else:
+                m = libname_bytes_match(line)
+                if m:
+                    lib_name = sys.intern(m['lib_name'].decode('ascii'))
+                    break
+        if self.stats is not None and end > start:
+            self.stats.regex_evaluations += end - i + 1
         return lib_name
 
     def _get_function_name(self, line):
         function_name = None
         description = None
-        m = re.match(self.regex_function, line)
+        if self.stats is not None:
+            self.stats.regex_evaluations += 1
+        m = self.classifier.function.match(line)
         if m:
-            function_name = m.groupdict()['function_name']
+            function_name = sys.intern(m.groupdict()['function_name'])
             description = self.sanitize_string(m.groupdict()['description'])
         return function_name, description
 
+    def _get_ascii_function_name(self, line):
+        # _get_function_name() for a MappedText.ascii_line(), only the
+        # captured name and description are made into str
+        function_name = None
+        description = None
+        if self.stats is not None:
+            self.stats.regex_evaluations += 1
+        m = self.classifier.function_bytes.match(line)
+        if m:
+            function_name = sys.intern(m['function_name'].decode('ascii'))
+            description = m['description'].decode('ascii')
+        return function_name, description
+
+    def _function_at(self, i):
+        # _get_function_name() for line i, remembering lines that are not function rows
+        flags = self.line_flags[i]
+        if flags & LINE_FUNCTION_CHECKED and not flags & LINE_FUNCTION:
+            return None, None
+        line = self.text.ascii_line(i) if isinstance(self.text, MappedText) else None
+        if line is None:
+            function_name, description = self._get_function_name(self.text[i])
+        else:
+            function_name, description = self._get_ascii_function_name(line)
+        self.line_flags[i] = flags | LINE_FUNCTION_CHECKED | (LINE_FUNCTION if function_name else 0)
+        return function_name, description
+
     def table_type(self, idx):
-        for i in range(idx, idx + self.TABLE_TYPE_RANGE):
-            if self.text[i].startswith('Routine') or self.text[i].startswith('Call'):
-                if self.text[i + 2] == 'Description':
-                    self.idx = i + 2
-                    return TableType.Intermingled.value
-                break
-        if i + 1 == idx + self.TABLE_TYPE_RANGE:
+        end = idx + self.TABLE_TYPE_RANGE
+        i = self._next_in(self.marker_lines, idx, end)
+        if i is None:
+            return None
+        if self._next_in(self.description_lines, i + 2, i + 3) is not None:
+            self.idx = i + 2
+            return TableType.Intermingled.value
+        if i + 1 == end:
             return None
         return TableType.RoutinesFirst.value
 
     def process_table_at_index(self, idx):
+        if self.stats is None:
+            return self._process_table_at_index(idx)
+        start = time.perf_counter()
+        table_info = self._process_table_at_index(idx)
+        self.stats.seconds['process_table_at_index'] += time.perf_counter() - start
+        if table_info.type:
+            self.stats.tables[TableType(table_info.type).name] += 1
+        else:
+            self.stats.tables_skipped += 1
+        return table_info
+
+    def _process_table_at_index(self, idx):
         self.idx = idx
-        self.idx = self.find_next_table_idx()
+        self.idx = self._next_in(self.table_lines, self.idx)
         tbl_name, tbl_desc = self.get_table_name_and_description(self.idx)
-        table_info = {'tbl_name': tbl_name, 'tbl_description': tbl_desc}
+        table_info = TableInfo(tbl_name, tbl_desc)
 
         start = self.idx - self.SEARCH_BACKWARD_RANGE
         if start < 0:
             start = 0
 
-        table_info['lib_name'] = self.search_libname_in_range(start, self.idx)
-        table_info['type'] = self.table_type(self.idx)
-        table_info['functions'] = []
-        table_info['descriptions'] = []
+        table_info.lib_name = self.search_libname_in_range(start, self.idx)
+        table_info.type = self.table_type(self.idx)
 
-        if TableType.RoutinesFirst.value == table_info['type']:
-            for i in range(self.idx, self.idx + self.PAGE_SIZE):
-                line = self.text[i]
-                if 'Description' == line:
+        if TableType.RoutinesFirst.value == table_info.type:
+            for i in self._window(self.idx, self.PAGE_SIZE):
+                flags = self.line_flags[i]
+                if flags & LINE_BLANK:
+                    continue
+                # only structural lines can be the header, others are not decoded for it
+                if flags & LINE_STRUCTURE and self.description_header == self.text[i]:
                     # End of the routine descriptions
                     break
-                function_name, maybe_desc = self._get_function_name(line)
+                function_name, maybe_desc = self._function_at(i)
                 if function_name:
-                    table_info['functions'].append(function_name)
+                    table_info.functions.append(function_name)
                 if maybe_desc:
-                    table_info['descriptions'].append(maybe_desc.strip())
-            self.idx = i + 1
-            description = ""
-            for i in range(self.idx, self.idx + self.PAGE_SIZE):
-                line = self.text[i]
-                description += line
-                if len(self.text[i + 1]) == 0:
-                    table_info['descriptions'].append(description.strip())
-                    description = ""
-                    if len(table_info['descriptions']) == len(table_info['functions']):
-                        break
+                    table_info.descriptions.append(maybe_desc.strip())
             self.idx = i + 1
-        elif TableType.Intermingled.value == table_info['type']:
+            # each description runs up to the line before the next blank line
+            i = self.idx
+            end = min(self.idx + self.PAGE_SIZE, len(self.text))
+            while i < end:
+                blank = self._next_in(self.blank_lines, i + 1, end + 1)
+                if blank is None:
+                    i = end
+                    break
+                table_info.descriptions.append(''.join(self.text[i:blank]).strip())
+                i = blank
+                if len(table_info.descriptions) == len(table_info.functions):
+                    break
+            self.idx = i
+        elif TableType.Intermingled.value == table_info.type:
             flag_found_function = False
-            for i in range(self.idx, self.idx + self.PAGE_SIZE):
+            for i in self._window(self.idx, self.PAGE_SIZE):
                 if i < self.idx:
                     # if we've processed a block of description text
                     # we move self.idx forward, but i will trail. So just cont
                     continue
-                line = self.text[i]
-                if '' == line:
+                flags = self.line_flags[i]
+                if flags & LINE_BLANK:
                     continue
 
-                if re.match(self.regex_page_number, line):
+                if flags & LINE_PAGE_NUMBER:
                     # reached the end of the page... done for now.
                     break
 
-                function_name, maybe_desc = self._get_function_name(line)
+                function_name, maybe_desc = self._function_at(i)
                 if maybe_desc:
-                    table_info['descriptions'].append(maybe_desc.strip())
+                    table_info.descriptions.append(maybe_desc.strip())
 
                 if function_name:
-                    table_info['functions'].append(function_name)
+                    table_info.functions.append(function_name)
                     if '' == maybe_desc:
                         flag_found_function = True
                 elif flag_found_function:
-                    if len(table_info['descriptions']) < len(table_info['functions']):
+                    if len(table_info.descriptions) < len(table_info.functions):
                         idx, description = self.extract_description_block_at_block(i)
                         self.idx = idx
-                        table_info['descriptions'].append(description.strip())
+                        table_info.descriptions.append(description.strip())
         else:
             # this is not a table we want to parse
             # advance idx so next reach for a table finds the next one
@@ -146,28 +879,28 @@ class PDFTextParser(object):
         return table_info
 
     def extract_description_block_at_block(self, idx):
-        description = ""
-        for i in range(idx, idx + self.PAGE_SIZE):
-            line = self.text[i]
-            if '' != line:
-                description = description + ' ' + line
-            else:
-                break
-        return i, description
+        # the block ends at the next blank line, or after PAGE_SIZE lines
+        end = self._next_in(self.blank_lines, idx, idx + self.PAGE_SIZE)
+        if end is None:
+            end = min(idx + self.PAGE_SIZE, len(self.text)) - 1
+            lines = self.text[idx:end + 1]
+        else:
+            lines = self.text[idx:end]
+        description = ' ' + ' '.join(lines) if lines else ''
+        return end, description
 
     @staticmethod
     def sanitize_string(input):
         return input.encode('ascii', 'ignore').decode('iso-8859-1')
 
     def get_table_name_and_description(self, idx):
-        regex = r'^(?P<tbl_name>Table\s+[\w+\d+]+.\d+)\s*?(?P<tbl_description>.*)'
-        line = self.text[idx]
-
-        m = re.match(regex, self.text[idx])
+        if self.stats is not None:
+            self.stats.regex_evaluations += 1
+        m = self.classifier.table_name.match(self.text[idx])
         if m:
             desc = m['tbl_description']
             if desc == '' or desc is None:
-                desc = self.text[idx + 2]
+                desc = self._line(idx + 2)
 
             desc = self.sanitize_string(desc)
             desc = desc.replace('(contd)', '').strip()
@@ -175,62 +908,1408 @@ class PDFTextParser(object):
 
         return None, None
 
+    def _table_lookahead(self):
+        # furthest a table at idx can read is idx + lookahead
+        return self.TABLE_TYPE_RANGE + 2 * self.PAGE_SIZE + 3
 
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser(description='parse text pdf output for symbols')
-    parser.add_argument('-f', '--files', required=True, nargs='+', help='pass file/files to analyze')
-    parser.add_argument('-o', '--output', help='json file to output to')
+    def iter_tables(self, start=0, end=None, known=None):
+        # Yields (idx, table_info) for each table heading in [start, end)
+        # that parses as a table, walking the parsed text once and leaving
+        # self.idx at the resume position. known maps heading indexes to an
+        # already computed (resume, table_info).
+        self.idx = start
+        while True:
+            idx = self.find_next_table_idx()
+            if idx is None or (end is not None and idx >= end):
+                break
+            if known is not None and idx in known:
+                self.idx, table_info = known[idx]
+            elif self.table_type(idx) is None:
+                # a heading mentioned in prose, skip the name and lib name
+                # lookups process_table_at_index() would make for it
+                self.idx = idx + 1
+                if self.stats is not None:
+                    self.stats.tables_skipped += 1
+                continue
+            elif self.errors is None:
+                table_info = self.process_table_at_index(idx)
+            else:
+                try:
+                    table_info = self.process_table_at_index(idx)
+                except Exception as e:
+                    self.errors.append(TableError(None, idx, f'{type(e).__name__}: {e}'))
+                    self.idx = idx + 1
+                    continue
+            if table_info.type:
+                yield idx, table_info
 
-    args = parser.parse_args()
-    library_dict = OrderedDict()
+    def shard_bounds(self, pages_per_shard):
+        # page aligned [start, end) line ranges, each ending right after a page number line
+        bounds = []
+        start = 0
+        for n, page_idx in enumerate(self.page_number_lines, 1):
+            if n % pages_per_shard == 0:
+                bounds.append((start, page_idx + 1))
+                start = page_idx + 1
+        if start < len(self.text):
+            bounds.append((start, len(self.text)))
+        return bounds
+
+    def page_fingerprints(self):
+        # [line count, digest] of each page of the parsed text
+        pages = []
+        for start, end in self.shard_bounds(1):
+            digest = hashlib.blake2b('\n'.join(self.text[start:end]).encode('utf-8'), digest_size=16)
+            pages.append([end - start, digest.hexdigest()])
+        return pages
+
+    def reusable_tables(self, pages, previous):
+        # known records for iter_tables() taken from an earlier run over
+        # another revision of the text. previous holds that run's pages and
+        # [idx, resume, table_info] records; a table is reused, moved to its
+        # new line numbers, when every line it could have read lies in a run
+        # of pages that is unchanged in this revision
+        def page_starts(page_list):
+            starts = [0]
+            for line_count, _ in page_list:
+                starts.append(starts[-1] + line_count)
+            return starts
+
+        old_pages = previous['pages']
+        old_starts = page_starts(old_pages)
+        new_starts = page_starts(pages)
+        records = previous['records']
+        heading_lines = [idx for idx, _, _ in records]
+        lookahead = self._table_lookahead()
+
+        known = {}
+        matcher = difflib.SequenceMatcher(None, [digest for _, digest in old_pages],
+                                          [digest for _, digest in pages], autojunk=False)
+        for a, b, size in matcher.get_matching_blocks():
+            if not size:
+                continue
+            lo, hi = old_starts[a], old_starts[a + size]
+            shift = new_starts[b] - lo
+            at_start = a == 0 and b == 0
+            at_end = a + size == len(old_pages) and b + size == len(pages)
+            for pos in range(bisect.bisect_left(heading_lines, lo), bisect.bisect_left(heading_lines, hi)):
+                idx, resume, table_info = records[pos]
+                if idx - self.SEARCH_BACKWARD_RANGE < lo and not at_start:
+                    continue
+                if idx + lookahead > hi and not at_end:
+                    continue
+                known[idx + shift] = (resume + shift, TableInfo.from_dict(table_info))
+        return known
+
+    def sharded_tables(self, executor, pages_per_shard=50):
+        # Same records as iter_tables() on the parsed text, with the table
+        # processing spread over executor. Each shard carries enough context
+        # on both sides to process every table heading it owns; the final
+        # walk here reuses those results and only processes headings the
+        # shard walks never reached, so output matches a serial walk,
+        # including "(contd)" tables split across shard boundaries.
+        lookahead = self._table_lookahead()
+        shards = []
+        for start, end in self.shard_bounds(pages_per_shard):
+            lo = max(start - self.SEARCH_BACKWARD_RANGE, 0)
+            hi = min(end + lookahead, len(self.text))
+            shards.append((self.text[lo:hi], lo, start, end))
+
+        known = {}
+        for shard_records in executor.map(partial(_process_shard, self.config()), shards):
+            known.update(shard_records)
+        return self.iter_tables(known=known)
+
+    def stream_tables(self, lines):
+        # Same records as parse() + iter_tables(), but read from an iterable
+        # of lines (e.g. an open file) while only holding a sliding window.
+        # A table at idx never reads past idx + lookahead, and never looks
+        # further back than SEARCH_BACKWARD_RANGE.
+        lookahead = self.TABLE_TYPE_RANGE + 2 * self.PAGE_SIZE + 3
+        window = 4 * lookahead + self.SEARCH_BACKWARD_RANGE
+        self.text = []
+        self.idx = 0
+        offset = 0
+        last = None
+        for line in lines:
+            self.text.append(line.strip())
+            last = line
+            if len(self.text) < window:
+                continue
+
+            self._timed_build_index()
+            limit = len(self.text) - lookahead
+            reported = len(self.errors) if self.errors is not None else 0
+            for idx, table_info in self.iter_tables(self.idx, limit):
+                yield offset + idx, table_info
+            self._shift_errors(reported, offset)
+
+            # no heading before limit is left, so the walk can resume there
+            # even after a stretch of text without tables
+            self.idx = max(self.idx, limit)
+            keep_from = max(limit - self.SEARCH_BACKWARD_RANGE, 0)
+            del self.text[:keep_from]
+            offset += keep_from
+            self.idx -= keep_from
+
+        # str.split('\n') yields a trailing empty line for text ending in a newline
+        if last is None or last.endswith('\n'):
+            self.text.append('')
+        self._timed_build_index()
+        reported = len(self.errors) if self.errors is not None else 0
+        for idx, table_info in self.iter_tables(self.idx):
+            yield offset + idx, table_info
+        self._shift_errors(reported, offset)
+
+    def _shift_errors(self, reported, offset):
+        # errors past the first reported ones were recorded at window line numbers
+        if self.errors is not None:
+            for error in self.errors[reported:]:
+                error.line += offset
+
+
+def _tagged_tables(n, pdf_p):
+    for idx, table_info in pdf_p.iter_tables():
+        yield idx, n, table_info
+
+
+def iter_layout_tables(parsers):
+    # (idx, table_info) of all parsers from parse_layouts() in line order;
+    # where several layouts parse a table at the same heading, the first wins
+    last_idx = None
+    for idx, _, table_info in heapq.merge(*(_tagged_tables(n, pdf_p) for n, pdf_p in enumerate(parsers))):
+        if idx != last_idx:
+            last_idx = idx
+            yield idx, table_info
+
+
+# Named layout profiles, each the parser settings (PDFTextParser.CONFIG_FIELDS)
+# a vendor's manuals need on top of the defaults, which are the VxWorks 6.6
+# kernel guide's. More profiles come from register_layout() or a json file
+# passed to load_layouts().
+LAYOUT_PROFILES = OrderedDict()
+DEFAULT_LAYOUT = 'vxworks-6.6'
+
+
+def register_layout(name, settings):
+    unknown = set(settings) - set(PDFTextParser.CONFIG_FIELDS)
+    if unknown:
+        raise ValueError(f'layout {name} has unknown settings: {", ".join(sorted(unknown))}')
+    LAYOUT_PROFILES[name] = dict(settings)
+
+
+def load_layouts(filename):
+    # registers the layouts of a json file, {"name": {"setting": value, ...}, ...}
+    with open(filename, 'r') as f:
+        layouts = json.load(f)
+    for name, settings in layouts.items():
+        register_layout(name, settings)
+    return list(layouts)
+
+
+def layout_configs(names):
+    # full parser configs of the named layouts, which can be handed to worker processes
+    configs = []
+    for name in names:
+        config = PDFTextParser().config()
+        config.update(LAYOUT_PROFILES[name])
+        configs.append(config)
+    return configs
+
+
+register_layout(DEFAULT_LAYOUT, {})
+
+
+class ResultCache(object):
+    # On-disk cache of per-file table records, keyed on the file content and
+    # the parser configuration. Least recently used entries are evicted once
+    # the cache grows past max_bytes.
+    FORMAT_VERSION = 1
+
+    def __init__(self, cache_dir=None, max_bytes=256 * 1024 * 1024):
+        if cache_dir is None:
+            cache_home = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+            cache_dir = os.path.join(cache_home, 'pdf_text_scraper')
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def key(self, filename, config):
+        digest = hashlib.sha256()
+        digest.update(json.dumps([self.FORMAT_VERSION, config], sort_keys=True).encode())
+        with open(filename, 'rb') as f:
+            for block in iter(partial(f.read, 1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.json')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'r') as f:
+                records = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # bump the mtime, eviction drops the least recently used entries first;
+        # another extraction's evict() may have removed the entry meanwhile
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return [(idx, TableInfo.from_dict(table_info)) for idx, table_info in records]
+
+    def put(self, key, records):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump([(idx, table_info.as_dict()) for idx, table_info in records], f)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            # evict() only sees finished entries, a left over temp file would never go
+            os.unlink(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        # entries may disappear under us when several extractions share the cache
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.json'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+class PageState(object):
+    # Per-page fingerprints and table records of the text files of an
+    # earlier run, kept next to its output so the next run only processes
+    # tables on pages that changed. Saved state is dropped when the parser
+    # settings change.
+    FORMAT_VERSION = 1
+
+    def __init__(self, path, config):
+        self.path = path
+        self.config = config
+        self.files = {}
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        if saved.get('format') == self.FORMAT_VERSION and saved.get('config') == self.config:
+            self.files = saved['files']
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            # dumps() uses the C encoder, dump() would encode chunk by chunk in Python
+            f.write(json.dumps({'format': self.FORMAT_VERSION, 'config': self.config, 'files': self.files}))
+        os.replace(tmp_path, self.path)
+
+
+def merge_table_info(library_dict, idx, table_info, conflicts=None):
+    # Merges one parsed table into library_dict by table name. A function
+    # already merged for the same table and lib name is not added again
+    # (one dict lookup per function), so repeated manuals and overlapping
+    # tables do not duplicate entries. Disagreements between occurrences are
+    # appended to conflicts as MergeConflicts when a list is given.
+    tblName = table_info.tbl_name
+    if tblName is None:
+        tblName = 'UnKnown'
+
+    library_table = library_dict.get(tblName)
+    if library_table is None:
+        library_table = library_dict[tblName] = LibraryTable(table_info.tbl_name, None, table_info.tbl_description)
+
+    # update if we don't have a description already
+    if '' == library_table.description:
+        library_table.description = table_info.tbl_description
+
+    # functions of the table's own lib (or of an unknown one) are keyed on
+    # None, those of another lib under the same table name are kept apart
+    key_lib = None
+    lib_name = table_info.lib_name
+    if library_table.lib_name is None or library_table.lib_placeholder:
+        if lib_name is None:
+            library_table.lib_name = f'lib_at_{str(idx)}'
+            library_table.lib_placeholder = True
+        else:
+            library_table.lib_name = sys.intern(lib_name)
+            library_table.lib_placeholder = False
+    elif lib_name is not None and lib_name != library_table.lib_name:
+        key_lib = sys.intern(lib_name)
+        if conflicts is not None:
+            conflicts.append(MergeConflict(library_table.table_name, None, 'lib_name', library_table.lib_name,
+                                           lib_name))
+
+    entry_index = library_table.entry_index
+    functions = library_table.functions
+    descriptions = table_info.descriptions
+    for i, name in enumerate(table_info.functions):
+        key = (key_lib, name)
+        entry = entry_index.get(key)
+        if entry is None:
+            entry = entry_index[key] = FunctionEntry(sys.intern(name), sys.intern(descriptions[i]))
+            functions.append(entry)
+        elif conflicts is not None and entry.description != descriptions[i]:
+            conflicts.append(MergeConflict(library_table.table_name, name, 'description', entry.description,
+                                           descriptions[i]))
+
+
+def write_json(library_dict, f):
+    # same text as json.dumps(library_dict, sort_keys=True, indent=2), written
+    # chunk by chunk instead of being built as one string first
+    for chunk in json.JSONEncoder(sort_keys=True, indent=2, default=_json_default).iterencode(library_dict):
+        f.write(chunk)
+
+
+class JSONLinesWriter(object):
+    # Writes one json object per table (or per function) as soon as it is
+    # parsed, so nothing has to be held back until the end of the run
+    def __init__(self, f, per_function=False):
+        self.f = f
+        self.per_function = per_function
+
+    def write(self, filename, idx, table_info):
+        lib_name = table_info.lib_name
+        if lib_name is None:
+            lib_name = f'lib_at_{str(idx)}'
+        table = {'file': filename, 'line': idx, 'table_name': table_info.tbl_name, 'lib_name': lib_name}
+        if self.per_function:
+            table['table_description'] = table_info.tbl_description
+            for entry in table_info.entries():
+                item = entry.as_dict()
+                item.update(table)
+                self.f.write(json.dumps(item, sort_keys=True) + '\n')
+        else:
+            table['description'] = table_info.tbl_description
+            table['functions'] = [entry.as_dict() for entry in table_info.entries()]
+            self.f.write(json.dumps(table, sort_keys=True) + '\n')
+
+
+class SQLiteWriter(object):
+    # Writes tables and their functions to a SQLite database with indexes
+    # on function and lib names and a full-text index over the function
+    # descriptions. Rows are inserted in bulk transactions into a temporary
+    # file that replaces path once close() has built the indexes. With
+    # append, rows are added to the database at path (created if missing)
+    # and each flush() commits them, indexed, as one transaction.
+    BATCH_TABLES = 1000
+    SCHEMA = (
+        'CREATE TABLE tables (id INTEGER PRIMARY KEY, file TEXT, line INTEGER, table_name TEXT, '
+        'lib_name TEXT, description TEXT)',
+        'CREATE TABLE functions (id INTEGER PRIMARY KEY, table_id INTEGER REFERENCES tables(id), '
+        'name TEXT, lib_name TEXT, description TEXT)',
+    )
+    INDEXES = (
+        'CREATE INDEX functions_name ON functions(name)',
+        'CREATE INDEX functions_lib_name ON functions(lib_name)',
+        'CREATE INDEX tables_lib_name ON tables(lib_name)',
+    )
+
+    def __init__(self, path, append=False):
+        self.path = path
+        self.append = append
+        self.tables = []
+        self.functions = []
+        if append:
+            self.tmp_path = None
+            self.db = sqlite3.connect(path)
+            for statement in self.SCHEMA + self.INDEXES:
+                self.db.execute(re.sub(r'^CREATE (TABLE|INDEX) ', r'CREATE \1 IF NOT EXISTS ', statement))
+            if self.db.execute("SELECT 1 FROM sqlite_master WHERE name = 'functions_fts'").fetchone():
+                self.fts = True
+            else:
+                self.fts = self._create_fts() is not None
+            self.db.commit()
+            self.table_id = self.db.execute('SELECT MAX(id) FROM tables').fetchone()[0] or 0
+            return
+
+        fd, self.tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+        os.close(fd)
+        os.chmod(self.tmp_path, 0o644)
+        # the temporary file is thrown away on failure, so skip the journal
+        self.db = sqlite3.connect(self.tmp_path)
+        self.db.execute('PRAGMA journal_mode = OFF')
+        self.db.execute('PRAGMA synchronous = OFF')
+        for statement in self.SCHEMA:
+            self.db.execute(statement)
+        self.table_id = 0
+
+    def write(self, filename, idx, table_info):
+        lib_name = table_info.lib_name
+        if lib_name is None:
+            lib_name = f'lib_at_{str(idx)}'
+        self.table_id += 1
+        self.tables.append((self.table_id, filename, idx, table_info.tbl_name, lib_name, table_info.tbl_description))
+        for entry in table_info.entries():
+            self.functions.append((self.table_id, entry.name, lib_name, entry.description))
+        if len(self.tables) >= self.BATCH_TABLES:
+            self.flush()
+
+    def flush(self):
+        with self.db:
+            if self.append and self.fts:
+                last_id = self.db.execute('SELECT MAX(id) FROM functions').fetchone()[0] or 0
+            self.db.executemany('INSERT INTO tables VALUES (?, ?, ?, ?, ?, ?)', self.tables)
+            self.db.executemany('INSERT INTO functions (table_id, name, lib_name, description) VALUES (?, ?, ?, ?)',
+                                self.functions)
+            if self.append and self.fts:
+                self.db.execute('INSERT INTO functions_fts(rowid, name, description) '
+                                'SELECT id, name, description FROM functions WHERE id > ?', (last_id,))
+        self.tables = []
+        self.functions = []
+
+    def remove_file(self, filename):
+        # drops the rows written for filename, e.g. before writing a changed
+        # version of it; only for append mode
+        self.flush()
+        with self.db:
+            self.db.execute('DELETE FROM functions WHERE table_id IN (SELECT id FROM tables WHERE file = ?)',
+                            (filename,))
+            removed = self.db.execute('DELETE FROM tables WHERE file = ?', (filename,)).rowcount
+            if removed and self.fts:
+                self.db.execute("INSERT INTO functions_fts(functions_fts) VALUES ('rebuild')")
+
+    def _create_fts(self):
+        # FTS5 when sqlite was built with it, FTS4 otherwise; without
+        # either the database only has the name indexes
+        for module in ('fts5', 'fts4'):
+            try:
+                # external content, rows are the functions rows (id is their rowid)
+                self.db.execute(f'CREATE VIRTUAL TABLE functions_fts USING {module}'
+                                f'(name, description, content="functions")')
+            except sqlite3.OperationalError:
+                continue
+            self.db.execute("INSERT INTO functions_fts(functions_fts) VALUES ('rebuild')")
+            return module
+        return None
+
+    def close(self):
+        if self.append:
+            self.flush()
+            self.db.close()
+            return
+        try:
+            self.flush()
+            with self.db:
+                for statement in self.INDEXES:
+                    self.db.execute(statement)
+                self._create_fts()
+        except BaseException:
+            self.discard()
+            raise
+        self.db.close()
+        os.replace(self.tmp_path, self.path)
+
+    def discard(self):
+        # leaves whatever was at path untouched, apart from batches already
+        # committed in append mode
+        self.db.close()
+        if self.append:
+            return
+        try:
+            os.remove(self.tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+def _process_shard(config, shard):
+    lines, offset, start, end = shard
+    # tables that fail to parse are left out of the results, the serial walk
+    # may never get to them; if it does it processes them itself and fails
+    # the same way a serial run would
+    pdf_p = PDFTextParser(errors=[])
+    pdf_p.configure(config)
+    pdf_p.text = lines
+    pdf_p.build_index()
+
+    known = {}
+    for idx, table_info in pdf_p.iter_tables(start - offset, end - offset):
+        known[idx + offset] = (pdf_p.idx + offset, table_info)
+    return known
+
+
+def _require_pdfminer():
+    if PDFPage is None:
+        raise RuntimeError('pdfminer is required to read PDF files directly, see requirements.txt')
+
+
+def pdf_page_count(filename):
+    _require_pdfminer()
+    with open(filename, 'rb') as fp:
+        document = PDFDocument(PDFParser(fp))
+        return resolve1(document.catalog['Pages'])['Count']
+
+
+def iter_pdf_page_text(filename, pagenos=None):
+    # text of each page, as pdf2txt.py would write it, produced one page at a time
+    _require_pdfminer()
+    rsrcmgr = PDFResourceManager()
+    buf = io.StringIO()
+    device = TextConverter(rsrcmgr, buf, laparams=LAParams())
+    interpreter = PDFPageInterpreter(rsrcmgr, device)
+    try:
+        with open(filename, 'rb') as fp:
+            for page in PDFPage.get_pages(fp, pagenos):
+                interpreter.process_page(page)
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+    finally:
+        device.close()
+
+
+def _pdf_pages_text(filename, pagenos):
+    return ''.join(iter_pdf_page_text(filename, set(pagenos)))
+
+
+def iter_pdf_text_parallel(filename, executor, pages_per_shard):
+    # page ranges are decoded in workers, results come back in page order
+    page_count = pdf_page_count(filename)
+    page_ranges = [range(start, min(start + pages_per_shard, page_count))
+                   for start in range(0, page_count, pages_per_shard)]
+    return executor.map(partial(_pdf_pages_text, filename), page_ranges)
+
+
+def iter_text_lines(chunks):
+    # re-split arbitrary text chunks into lines the way iterating a text file does
+    pending = ''
+    for chunk in chunks:
+        lines = (pending + chunk).split('\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line + '\n'
+    if pending:
+        yield pending
+
+
+def _name_errors(errors, reported, filename):
+    # errors past the first reported ones came from parsing filename
+    if errors is not None:
+        for error in errors[reported:]:
+            error.file = filename
+
+
+# text dumps archived compressed, read through the matching module
+COMPRESSED_OPENERS = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+
+
+def is_compressed(filename):
+    return os.path.splitext(filename)[1].lower() in COMPRESSED_OPENERS
+
+
+def open_text(filename):
+    # a text dump opened the way the parser reads it, decompressed on the
+    # fly (without a temporary file) when it ends in .gz, .bz2 or .xz
+    opener = COMPRESSED_OPENERS.get(os.path.splitext(filename)[1].lower(), open)
+    return opener(filename, 'rt', encoding='ISO-8859-1')
+
+
+def iter_file_tables(filename, reader='read', executor=None, pages_per_shard=None, stats=None, layouts=None,
+                     errors=None):
+    # (idx, table_info) records of one file in document order, produced as they are found.
+    # reader picks how text files are read: 'read' loads them whole, 'stream'
+    # keeps a sliding window of lines and 'mmap' decodes lines on demand;
+    # compressed files can not be mapped and are streamed instead.
+    # layouts are the parser configs to use (see layout_configs()), the
+    # defaults when None; several layouts are tried in one pass over the text.
+    # With an errors list, tables that fail to parse are skipped and
+    # reported there as TableErrors instead of ending the run
+    reported = len(errors) if errors is not None else 0
+    try:
+        yield from _iter_file_tables(filename, reader, executor, pages_per_shard, stats, layouts, errors)
+    finally:
+        _name_errors(errors, reported, filename)
+
+
+def _iter_file_tables(filename, reader, executor, pages_per_shard, stats, layouts, errors):
+    if layouts is not None and len(layouts) > 1:
+        yield from _iter_file_layout_tables(filename, reader, executor, pages_per_shard, stats, layouts, errors)
+        return
+
+    pdf_p = PDFTextParser(stats, errors)
+    if layouts:
+        pdf_p.configure(layouts[0])
+    if filename.lower().endswith('.pdf'):
+        if executor is not None and pages_per_shard:
+            chunks = iter_pdf_text_parallel(filename, executor, pages_per_shard)
+        else:
+            chunks = iter_pdf_page_text(filename)
+        yield from pdf_p.stream_tables(iter_text_lines(chunks))
+        return
+
+    if reader == 'mmap' and is_compressed(filename):
+        # shards need the whole text, a plain walk can do with a window
+        reader = 'read' if executor is not None and pages_per_shard else 'stream'
+
+    if reader == 'stream':
+        with open_text(filename) as f:
+            yield from pdf_p.stream_tables(f)
+        return
+
+    if reader == 'mmap':
+        pdf_p.parse_file(filename)
+    else:
+        with open_text(filename) as f:
+            pdf_p.parse(f.read())
+
+    try:
+        if executor is not None and pages_per_shard:
+            yield from pdf_p.sharded_tables(executor, pages_per_shard)
+        else:
+            yield from pdf_p.iter_tables()
+    finally:
+        if isinstance(pdf_p.text, MappedText):
+            pdf_p.text.close()
+
+
+def _iter_file_layout_tables(filename, reader, executor, pages_per_shard, stats, layouts, errors):
+    # iter_file_tables() with several layouts, which all walk the whole text
+    if reader == 'stream' and not filename.lower().endswith('.pdf'):
+        raise ValueError('several layouts need the whole text, they can not be used with the stream reader')
+    if filename.lower().endswith('.pdf'):
+        if executor is not None and pages_per_shard:
+            text = ''.join(iter_pdf_text_parallel(filename, executor, pages_per_shard))
+        else:
+            text = ''.join(iter_pdf_page_text(filename))
+    elif reader == 'mmap' and not is_compressed(filename):
+        text = MappedText(filename)
+    else:
+        with open_text(filename) as f:
+            text = f.read()
+
+    try:
+        yield from iter_layout_tables(PDFTextParser.parse_layouts(text, layouts, stats, errors))
+    finally:
+        if isinstance(text, MappedText):
+            text.close()
+
+
+def extract_file_tables(filename, reader='read', executor=None, pages_per_shard=None, stats=None, layouts=None,
+                        errors=None):
+    # module level so it can be handed to worker processes
+    return list(iter_file_tables(filename, reader, executor, pages_per_shard, stats, layouts, errors))
+
+
+def _collect_errors(extract, *args):
+    # (result, TableErrors) of extract(*args), run with its own errors list
+    # so a worker process can hand the errors back
+    errors = []
+    return extract(*args, errors=errors), errors
+
+
+def extract_file_incremental(filename, previous=None, reader='read', stats=None, layouts=None, errors=None):
+    # (records, file state) of a text file, reusing the tables of previous
+    # (its file state from an earlier run) that sit on unchanged pages.
+    # Resume positions only make sense for a single layout
+    if layouts is not None and len(layouts) > 1:
+        raise ValueError('incremental extraction only supports a single layout')
+    reported = len(errors) if errors is not None else 0
+    pdf_p = PDFTextParser(stats, errors)
+    if layouts:
+        pdf_p.configure(layouts[0])
+    if reader == 'mmap' and not is_compressed(filename):
+        pdf_p.parse_file(filename)
+    else:
+        with open_text(filename) as f:
+            pdf_p.parse(f.read())
+
+    try:
+        pages = pdf_p.page_fingerprints()
+        known = pdf_p.reusable_tables(pages, previous) if previous else None
+        records = []
+        state_records = []
+        for idx, table_info in pdf_p.iter_tables(known=known):
+            records.append((idx, table_info))
+            state_records.append([idx, pdf_p.idx, table_info.as_dict()])
+    finally:
+        if isinstance(pdf_p.text, MappedText):
+            pdf_p.text.close()
+        _name_errors(errors, reported, filename)
+    return records, {'pages': pages, 'records': state_records}
 
-    for filename in args.files:
-        with open(filename, 'r', encoding="ISO-8859-1") as f:
-            data = f.read()
-            pdf_p = PDFTextParser()
-            pdf_p.parse(data)
-            idx = 0
-            while idx < len(data):
-                idx = pdf_p.find_next_table_idx()
-                if idx:
-                    pdf_p.idx = idx
-                    table_info = pdf_p.process_table_at_index(idx)
-                    if table_info['type']:
-                        tblName = table_info['tbl_name']
-                        if tblName is None:
-                            tblName = 'UnKnown'
-
-                        if tblName not in library_dict:
-                            library_dict[tblName] = {'table_name': table_info['tbl_name'],
-                                                     'lib_name': None,
-                                                     'description': table_info['tbl_description'],
-                                                     'functions': []}
-
-                        # update if we don't have a description already
-                        if '' == library_dict[tblName]['description']:
-                            library_dict[tblName]['description'] = table_info['tbl_description']
-
-                        if library_dict[tblName]['lib_name'] is None or 'lib_at' in library_dict[tblName]['lib_name']:
-                            libName = table_info['lib_name']
-
-                            if libName is None:
-                                libName = f'lib_at_{str(idx)}'
-
-                            library_dict[tblName]['lib_name'] = libName
-
-                        for i in range(len(table_info['functions'])):
-                            item = {'name': table_info['functions'][i], 'description': table_info['descriptions'][i]}
-                            library_dict[tblName]['functions'].append(item)
 
+def extract_files(filenames, jobs=1, reader='read', pages_per_shard=None, cache=None, state=None, stats=None,
+                  layouts=None, errors=None):
+    # yields (filename, records) in input order; records come from the cache
+    # when the file and parser settings are unchanged, otherwise the file is parsed.
+    # With a PageState, text files are extracted incrementally against it
+    # instead, and state is updated to describe them. stats (a ParserStats)
+    # only counts what is parsed in this process, not in worker processes.
+    # With an errors list, tables that fail to parse are reported there and
+    # skipped, and files with such tables are not cached
+    config = layouts if layouts is not None else PDFTextParser().config()
+    tracked = []
+    if state is not None:
+        tracked = [filename for filename in OrderedDict.fromkeys(filenames) if not filename.lower().endswith('.pdf')]
+    cached = {}
+    if cache is not None:
+        for filename in filenames:
+            if filename not in tracked:
+                key = cache.key(filename, config)
+                cached[filename] = (key, cache.get(key))
+
+    executor = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+    try:
+        computed = {}
+        if tracked:
+            previous = [state.files.get(filename) for filename in tracked]
+            extract = partial(extract_file_incremental, reader=reader, stats=stats, layouts=layouts)
+            if errors is not None:
+                extract = partial(_collect_errors, extract)
+            mapper = executor.map if executor is not None else map
+            state.files = {}
+            for filename, result in zip(tracked, mapper(extract, tracked, previous)):
+                if errors is not None:
+                    result, file_errors = result
+                    errors.extend(file_errors)
+                computed[filename], state.files[filename] = result
+
+        results = iter(())
+        parallel = set()
+        if executor is not None and not pages_per_shard:
+            misses = [filename for filename in OrderedDict.fromkeys(filenames)
+                      if filename not in computed and cached.get(filename, (None, None))[1] is None]
+            parallel.update(misses)
+            # map() hands results back in input order, so merging stays identical to a serial run;
+            # each one is only taken when its file's turn comes below
+            extract = partial(extract_file_tables, reader=reader, layouts=layouts)
+            if errors is not None:
+                extract = partial(_collect_errors, extract)
+            results = executor.map(extract, misses)
+
+        def store(filename, key, records):
+            # files with failed tables stay out of the cache so reruns report them again
+            if not (errors and any(error.file == filename for error in errors)):
+                cache.put(key, records)
+            cached[filename] = (key, records)
+
+        def cache_tables(filename, key, tables):
+            # passes the tables through as they are parsed and caches the file once it is complete
+            records = []
+            for record in tables:
+                records.append(record)
+                yield record
+            store(filename, key, records)
+
+        last = {filename: i for i, filename in enumerate(filenames)}
+        for i, filename in enumerate(filenames):
+            key, records = cached.get(filename, (None, None))
+            if records is None:
+                if filename in computed:
+                    # tracked by state, which keeps these instead of the cache
+                    records = computed[filename]
+                elif filename in parallel:
+                    records = next(results)
+                    if errors is not None:
+                        records, file_errors = records
+                        errors.extend(file_errors)
+                    if cache is not None:
+                        store(filename, key, records)
+                    elif last[filename] > i:
+                        computed[filename] = records
                 else:
+                    records = iter_file_tables(filename, reader, executor, pages_per_shard, stats, layouts, errors)
+                    if cache is not None:
+                        records = cache_tables(filename, key, records)
+            yield filename, records
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def extract_request(request, reader='read', cache=None, layouts=None):
+    # merged tables of one server request, {"files": [...], "texts": [...]},
+    # in the order the CLI would merge them
+    library_dict = OrderedDict()
+    for filename, records in extract_files(request.get('files', []), reader=reader, cache=cache, layouts=layouts):
+        for idx, table_info in records:
+            merge_table_info(library_dict, idx, table_info)
+    for text in request.get('texts', []):
+        parsers = PDFTextParser.parse_layouts(text, layouts or [PDFTextParser().config()])
+        for idx, table_info in iter_layout_tables(parsers):
+            merge_table_info(library_dict, idx, table_info)
+    return library_dict
+
+
+class ExtractionServer(object):
+    # Serves extraction requests over a Unix socket or a localhost TCP
+    # port, so the interpreter, imports and compiled patterns stay warm
+    # between calls. Each line sent is a json request, each line sent
+    # back the json response to it:
+    #   {"id": 1, "files": ["manual.txt"], "texts": ["...pdf2txt.py output..."]}
+    #   {"id": 1, "tables": {...}, "timing": {"queued": s, "extract": s, "total": s}}
+    # At most max_concurrent requests are extracted at a time, in worker
+    # processes with jobs > 1 and in threads otherwise.
+    MAX_REQUEST_BYTES = 256 * 1024 * 1024
+
+    def __init__(self, jobs=1, max_concurrent=4, reader='read', cache=None, layouts=None):
+        self.reader = reader
+        self.cache = cache
+        self.layouts = layouts
+        self.executor = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+        self.max_concurrent = max_concurrent
+        self.semaphore = None
+
+    async def handle(self, line):
+        start = time.perf_counter()
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError('a request is a json object')
+            for field in ('files', 'texts'):
+                items = request.get(field, [])
+                if not isinstance(items, list) or not all(isinstance(item, str) for item in items):
+                    raise ValueError(f'{field} is a list of strings')
+        except ValueError as e:
+            return {'error': f'bad request: {e}'}
+
+        response = {'id': request.get('id')}
+        async with self.semaphore:
+            started = time.perf_counter()
+            import asyncio
+            loop = asyncio.get_running_loop()
+            try:
+                response['tables'] = await loop.run_in_executor(
+                    self.executor, partial(extract_request, request, self.reader, self.cache, self.layouts))
+            except Exception as e:
+                response['error'] = f'{type(e).__name__}: {e}'
+            extracted = time.perf_counter()
+        response['timing'] = {'queued': started - start, 'extract': extracted - started,
+                              'total': time.perf_counter() - start}
+        return response
+
+    async def _serve_connection(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
                     break
+                response = await self.handle(line)
+                writer.write(json.dumps(response, default=_json_default).encode() + b'\n')
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def start(self, address):
+        # address is host:port for TCP, anything else is a Unix socket path;
+        # asyncio is imported here to keep it out of the startup of plain runs
+        import asyncio
+        self.semaphore = asyncio.Semaphore(self.max_concurrent)
+        host, sep, port = address.rpartition(':')
+        if sep and port.isdigit():
+            return await asyncio.start_server(self._serve_connection, host or '127.0.0.1', int(port),
+                                              limit=self.MAX_REQUEST_BYTES)
+        return await asyncio.start_unix_server(self._serve_connection, address, limit=self.MAX_REQUEST_BYTES)
+
+    async def serve(self, address):
+        server = await self.start(address)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown()
+
+
+def _ignore_sigint():
+    # worker processes leave Ctrl-C to the process that shuts them down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class DirectoryWatcher(object):
+    # Polls directory for new or changed manuals (pdf2txt.py output or
+    # PDFs) and extracts each one once it has stopped changing between two
+    # polls. Extracted files are handed to emit(filename, records, changed)
+    # as they complete, changed telling a new version of a file already
+    # emitted. At most max_pending files are queued or being extracted at
+    # a time; others wait in the directory until a slot frees up, so a
+    # burst of large manuals never holds more than max_pending files'
+    # records. Emitted versions are kept in state_path, so a restart only
+    # picks up files that are new or changed since.
+    FORMAT_VERSION = 1
+    EXTENSIONS = ('.txt', '.pdf') + tuple(COMPRESSED_OPENERS)
+
+    def __init__(self, directory, emit, jobs=1, max_pending=None, reader='read', cache=None, layouts=None,
+                 state_path=None, poll_interval=2.0, errors=None):
+        self.directory = directory
+        self.emit = emit
+        self.reader = reader
+        self.cache = cache
+        self.layouts = layouts
+        self.config = layouts if layouts is not None else PDFTextParser().config()
+        self.state_path = state_path
+        self.poll_interval = poll_interval
+        # with an errors list, tables that fail to parse are reported there and skipped
+        self.errors = errors
+        self.max_pending = max_pending or 2 * jobs
+        # a thread keeps polling responsive while a single file is parsed
+        if jobs > 1:
+            self.executor = ProcessPoolExecutor(max_workers=jobs, initializer=_ignore_sigint)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=1)
+        # path -> [size, mtime_ns] of the version emitted, and of what the last poll saw
+        self.done = {}
+        self.last_seen = {}
+        # future -> (path, [size, mtime_ns], cache key)
+        self.pending = {}
+        self.load()
+
+    def load(self):
+        if self.state_path is None:
+            return
+        try:
+            with open(self.state_path, 'r') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        if saved.get('format') == self.FORMAT_VERSION and saved.get('config') == self.config:
+            self.done = saved['files']
+
+    def save(self):
+        if self.state_path is None:
+            return
+        directory = os.path.dirname(os.path.abspath(self.state_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            f.write(json.dumps({'format': self.FORMAT_VERSION, 'config': self.config, 'files': self.done}))
+        os.replace(tmp_path, self.state_path)
+
+    def scan(self):
+        # path -> [size, mtime_ns] of the manuals in the directory
+        files = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.startswith('.') or not entry.name.lower().endswith(self.EXTENSIONS):
+                    continue
+                try:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        files[entry.path] = [stat.st_size, stat.st_mtime_ns]
+                except FileNotFoundError:
+                    continue
+        return files
+
+    def poll(self, timeout=0):
+        # Emits the extractions that finish within timeout seconds, then
+        # queues the files that did not change since the last poll, as far
+        # as max_pending allows
+        self.collect(timeout)
+        files = self.scan()
+        queued = {path for path, _, _ in self.pending.values()}
+        for path, version in sorted(files.items()):
+            if len(self.pending) >= self.max_pending:
+                break
+            if path not in queued and self.done.get(path) != version and self.last_seen.get(path) == version:
+                self.submit(path, version)
+        self.last_seen = files
+
+    def submit(self, path, version):
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(path, self.config)
+            records = self.cache.get(key)
+            if records is not None:
+                self.finish(path, version, records)
+                return
+        extract = partial(extract_file_tables, reader=self.reader, layouts=self.layouts)
+        if self.errors is not None:
+            extract = partial(_collect_errors, extract)
+        self.pending[self.executor.submit(extract, path)] = (path, version, key)
+
+    def collect(self, timeout=0):
+        if not self.pending:
+            return
+        done, _ = wait(self.pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            path, version, key = self.pending.pop(future)
+            try:
+                records = future.result()
+            except Exception as e:
+                # dropped until the file changes again, the watch goes on
+                print(f'{path}: {type(e).__name__}: {e}', file=sys.stderr)
+                self.done[path] = version
+                self.save()
+                continue
+            failed = False
+            if self.errors is not None:
+                records, file_errors = records
+                self.errors.extend(file_errors)
+                failed = bool(file_errors)
+            if self.cache is not None and not failed:
+                self.cache.put(key, records)
+            self.finish(path, version, records)
+
+    def finish(self, path, version, records):
+        self.emit(path, records, path in self.done)
+        self.done[path] = version
+        self.save()
+
+    def run(self):
+        try:
+            while True:
+                self.poll()
+                if self.pending:
+                    # wakes up early when an extraction finishes
+                    self.collect(self.poll_interval)
+                else:
+                    time.sleep(self.poll_interval)
+        finally:
+            self.close()
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+
+def _write_report(records, destination):
+    # json list of records (TableErrors, MergeConflicts) to a file, or to stderr when there are any
+    if records is not None and (records or destination != '-'):
+        report = json.dumps([record.as_dict() for record in records], indent=2)
+        if destination == '-':
+            print(report, file=sys.stderr)
+        else:
+            with open(destination, 'w') as report_file:
+                report_file.write(report + '\n')
+
 
+def _watch(args, cache, layouts, errors):
+    # --watch: appends the tables of each file to the outputs as it is extracted, until interrupted
+    f = open(args.output, 'a') if args.output else None
+    writer = JSONLinesWriter(f, per_function=args.format == 'jsonl-functions') if f is not None else None
+    db = SQLiteWriter(args.output_db, append=True) if args.output_db else None
+
+    def emit(filename, records, changed):
+        if db is not None:
+            # a changed file replaces its rows, jsonl consumers get its tables again
+            if changed:
+                db.remove_file(filename)
+            for idx, table_info in records:
+                db.write(filename, idx, table_info)
+            db.flush()
+        if writer is not None:
+            for idx, table_info in records:
+                writer.write(filename, idx, table_info)
+            f.flush()
+
+    watcher = DirectoryWatcher(args.watch, emit, args.jobs, args.max_pending, args.reader, cache, layouts,
+                               (args.output or args.output_db) + '.watch.json', args.poll_interval, errors)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if f is not None:
+            f.close()
+        if db is not None:
+            db.close()
+
+
+def function_index(records):
+    # {(lib_name, table_name, function name): description} over a run of
+    # (idx, TableInfo) records; table_name is only set for tables without a
+    # lib name, so their functions are not lumped together across tables.
+    # The first occurrence of a function in a lib wins, like in the merged json
+    index = {}
+    for idx, table_info in records:
+        lib_name = table_info.lib_name
+        table_name = table_info.tbl_name if lib_name is None else None
+        for name, description in zip(table_info.functions, table_info.descriptions):
+            index.setdefault((lib_name, table_name, name), description)
+    return index
+
+
+def diff_editions(old_index, new_index):
+    # added, removed and changed functions per lib between two function_index
+    # results. Descriptions that only differ in whitespace are not changes,
+    # nor are moved line breaks, which RoutinesFirst tables join without a
+    # space. Libs are sorted by name, tables without a lib last
+    libs = {}
+
+    def lib(key):
+        entry = libs.get(key[:2])
+        if entry is None:
+            entry = libs[key[:2]] = {'lib_name': key[0], 'added': [], 'removed': [], 'changed': []}
+            if key[0] is None:
+                entry['table_name'] = key[1]
+        return entry
+
+    for key in new_index.keys() - old_index.keys():
+        lib(key)['added'].append({'name': key[2], 'description': new_index[key]})
+    for key in old_index.keys() - new_index.keys():
+        lib(key)['removed'].append(key[2])
+    unchanged = 0
+    for key in old_index.keys() & new_index.keys():
+        old, new = old_index[key], new_index[key]
+        if old == new or ''.join(old.split()) == ''.join(new.split()):
+            unchanged += 1
+        else:
+            lib(key)['changed'].append({'name': key[2], 'old': old, 'new': new})
+
+    summary = {'added': 0, 'removed': 0, 'changed': 0, 'unchanged': unchanged}
+    report = []
+    for lib_key in sorted(libs, key=lambda key: (key[0] is None, key[0] or '', key[1] or '')):
+        entry = libs[lib_key]
+        for change in ('added', 'removed', 'changed'):
+            summary[change] += len(entry[change])
+            if entry[change]:
+                entry[change].sort(key=lambda item: item if isinstance(item, str) else item['name'])
+            else:
+                del entry[change]
+        report.append(entry)
+    return {'summary': summary, 'libs': report}
+
+
+def _add_extraction_arguments(parser):
+    # how files are read and parsed, shared by the extraction and diff command lines
+    readers = parser.add_mutually_exclusive_group()
+    readers.add_argument('--stream', dest='reader', action='store_const', const='stream', default='read',
+                         help='read input files line by line with bounded memory instead of loading them whole')
+    readers.add_argument('--mmap', dest='reader', action='store_const', const='mmap',
+                         help='memory map input files and only decode the lines the parser looks at')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of worker processes used to parse files (default: 1)')
+    parser.add_argument('--layout', nargs='+', default=[DEFAULT_LAYOUT], metavar='NAME',
+                        help=f'layout profiles to try, in order of preference, or "all" for every registered one; '
+                             f'several are tried in a single pass over each file (default: {DEFAULT_LAYOUT})')
+    parser.add_argument('--layout-file', action='append', default=[],
+                        help='json file of more layout profiles, {"name": {"setting": value, ...}}, where settings '
+                             'are PDFTextParser config fields')
+    parser.add_argument('--no-cache', action='store_true', help='do not read or write the result cache')
+    parser.add_argument('--cache-dir', help='result cache directory (default: ~/.cache/pdf_text_scraper)')
+    parser.add_argument('--cache-size', type=int, default=256,
+                        help='result cache size limit in MB, least recently used entries are evicted (default: 256)')
+
+
+def _layout_configs_from_args(parser, args):
+    try:
+        for filename in args.layout_file:
+            load_layouts(filename)
+    except (OSError, ValueError) as e:
+        parser.error(f'bad --layout-file: {e}')
+    if args.layout == ['all']:
+        args.layout = list(LAYOUT_PROFILES)
+    unknown = [name for name in args.layout if name not in LAYOUT_PROFILES]
+    if unknown:
+        parser.error(f'unknown layout {", ".join(unknown)}, registered: {", ".join(LAYOUT_PROFILES)}')
+    layouts = layout_configs(args.layout)
+    return layouts
+
+
+def _cache_from_args(args):
+    if args.no_cache:
+        return None
+    return ResultCache(args.cache_dir, args.cache_size * 1024 * 1024)
+
+
+def _diff(argv):
+    parser = argparse.ArgumentParser(prog=f'{os.path.basename(sys.argv[0])} diff',
+                                     description='compare the functions of two manual editions')
+    parser.add_argument('--old', nargs='+', required=True, metavar='FILE',
+                        help='files of the older edition, pdf2txt.py output (optionally compressed) or .pdf files')
+    parser.add_argument('--new', nargs='+', required=True, metavar='FILE', help='files of the newer edition')
+    parser.add_argument('-o', '--output', help='json file to write the change report to (default: stdout)')
+    _add_extraction_arguments(parser)
+    args = parser.parse_args(argv)
+    layouts = _layout_configs_from_args(parser, args)
+    if len(layouts) > 1 and args.reader == 'stream':
+        parser.error('several layouts need the whole text, they can not be combined with --stream')
+    cache = _cache_from_args(args)
+
+    # both editions go through one extract_files run so they share the worker
+    # pool; results come back in input order, the old edition's files first
+    old_records = []
+    new_records = []
+    files = extract_files(args.old + args.new, args.jobs, args.reader, cache=cache, layouts=layouts)
+    for i, (filename, records) in enumerate(files):
+        (old_records if i < len(args.old) else new_records).extend(records)
+    report = json.dumps(diff_editions(function_index(old_records), function_index(new_records)), indent=2)
     if args.output:
         with open(args.output, 'w') as f:
-            #for i in library_dict:
-            #    pprint(library_dict[i])
-            #    print('-'*80)
-            #    print(json.dumps(library_dict[i], sort_keys=True, indent=2))
-            f.write(json.dumps(library_dict, sort_keys=True, indent=2))
+            f.write(report + '\n')
     else:
-        print(json.dumps(library_dict, sort_keys=True, indent=2))
+        print(report)
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv[:1] == ['diff']:
+        return _diff(argv[1:])
+    parser = argparse.ArgumentParser(description='parse text pdf output for symbols',
+                                     epilog='run "%(prog)s diff -h" to compare two editions of a manual instead')
+    parser.add_argument('-f', '--files', nargs='+',
+                        help='pass file/files to analyze, pdf2txt.py output (optionally .gz, .bz2 or .xz compressed) '
+                             'or .pdf files')
+    parser.add_argument('-o', '--output', help='json file to output to')
+    parser.add_argument('--output-db',
+                        help='also write tables and functions to this SQLite database, indexed by function and '
+                             'lib name and full-text searchable by description; json is then only written with -o')
+    parser.add_argument('--format', choices=('json', 'jsonl', 'jsonl-functions'), default='json',
+                        help='json: tables merged by name (default), jsonl: one line per table as it is parsed, '
+                             'jsonl-functions: one line per function as it is parsed')
+    _add_extraction_arguments(parser)
+    parser.add_argument('--shard-pages', type=int,
+                        help='with --jobs, split each file (or PDF page range) into shards of this many pages '
+                             'and parse them in parallel')
+    parser.add_argument('--incremental', action='store_true',
+                        help='keep per-page fingerprints of the text files next to the output (OUTPUT.pages.json) '
+                             'and on later runs only re-process tables on pages that changed')
+    parser.add_argument('--serve', metavar='ADDRESS',
+                        help='instead of parsing -f files, serve newline delimited json requests on a Unix socket '
+                             'path or a localhost host:port')
+    parser.add_argument('--watch', metavar='DIR',
+                        help='instead of parsing -f files, keep polling DIR for new or changed manuals and append '
+                             'their tables to -o (jsonl formats) and/or --output-db as each one is extracted')
+    parser.add_argument('--poll-interval', type=float, default=2.0,
+                        help='with --watch, seconds between directory scans; files are extracted once they did '
+                             'not change between two scans (default: 2)')
+    parser.add_argument('--max-pending', type=int,
+                        help='with --watch, files queued or being extracted at a time, later ones wait in the '
+                             'directory (default: twice --jobs)')
+    parser.add_argument('--max-concurrent', type=int, default=4,
+                        help='with --serve, number of requests extracted at the same time (default: 4)')
+    parser.add_argument('--profile', nargs='?', const='-', metavar='REPORT',
+                        help='write a json report of parser counters and seconds per phase to REPORT (default: '
+                             'stderr); files are then parsed in this process, without -j or the result cache')
+    parser.add_argument('--keep-going', nargs='?', const='-', metavar='REPORT',
+                        help='skip tables that fail to parse instead of stopping, and write a json report of them '
+                             '(file, line, reason) to REPORT (default: stderr, only when a table failed)')
+    parser.add_argument('--conflicts', nargs='?', const='-', metavar='REPORT',
+                        help='with --format json, write a json report of merged tables whose occurrences disagree '
+                             'on the lib name or a function description to REPORT (default: stderr, only when '
+                             'there are any)')
+
+    args = parser.parse_args(argv)
+    if not args.files and not args.serve and not args.watch:
+        parser.error('one of -f/--files, --serve or --watch is required')
+    layouts = _layout_configs_from_args(parser, args)
+    if len(layouts) > 1 and args.reader == 'stream':
+        parser.error('several layouts need the whole text, they can not be combined with --stream')
+    if len(layouts) > 1 and args.incremental:
+        parser.error('--incremental only supports a single layout')
+    if args.incremental and not (args.output or args.output_db):
+        parser.error('--incremental needs -o/--output or --output-db to keep its page fingerprints next to')
+    if args.incremental and args.reader == 'stream':
+        parser.error('--incremental needs the whole text, it can not be combined with --stream')
+    if args.watch and not (args.output or args.output_db):
+        parser.error('--watch appends to -o/--output or --output-db, one of them is required')
+    if args.watch and args.output and args.format == 'json':
+        parser.error('--watch can not append to merged json, use --format jsonl or jsonl-functions')
+    if args.watch and (args.incremental or args.profile or args.shard_pages or args.conflicts):
+        parser.error('--watch can not be combined with --incremental, --profile, --shard-pages or --conflicts')
+    if args.conflicts and (args.format != 'json' or (args.output_db and not args.output)):
+        parser.error('--conflicts reports on the merged json output, it needs --format json and -o with --output-db')
+
+    stats = None
+    if args.profile:
+        stats = ParserStats()
+        args.jobs = 1
+        args.no_cache = True
+
+    cache = _cache_from_args(args)
+    if args.serve:
+        import asyncio
+        server = ExtractionServer(args.jobs, args.max_concurrent, args.reader, cache, layouts)
+        try:
+            asyncio.run(server.serve(args.serve))
+        except KeyboardInterrupt:
+            pass
+        return
+
+    errors = [] if args.keep_going else None
+    conflicts = [] if args.conflicts else None
+    if args.watch:
+        _watch(args, cache, layouts, errors)
+        _write_report(errors, args.keep_going)
+        return
+
+    state = None
+    if args.incremental:
+        state = PageState((args.output or args.output_db) + '.pages.json', layouts)
+        state.load()
+
+    f = None
+    if args.output:
+        f = open(args.output, 'w')
+    elif not args.output_db:
+        f = sys.stdout
+    library_dict = None
+    writer = None
+    if f is not None:
+        if args.format == 'json':
+            library_dict = OrderedDict()
+        else:
+            writer = JSONLinesWriter(f, per_function=args.format == 'jsonl-functions')
+    db = SQLiteWriter(args.output_db) if args.output_db else None
+
+    def emit(filename, idx, table_info):
+        if library_dict is not None:
+            merge_table_info(library_dict, idx, table_info, conflicts)
+        if writer is not None:
+            writer.write(filename, idx, table_info)
+        if db is not None:
+            db.write(filename, idx, table_info)
+
+    def finish():
+        if library_dict is not None:
+            write_json(library_dict, f)
+        if db is not None:
+            db.close()
+
+    if stats is not None:
+        emit = stats.timed('output', emit)
+        finish = stats.timed('output', finish)
+
+    start = time.perf_counter()
+    try:
+        files = extract_files(args.files, args.jobs, args.reader, args.shard_pages, cache, state, stats, layouts,
+                              errors)
+        for filename, records in files:
+            for idx, table_info in records:
+                emit(filename, idx, table_info)
+        finish()
+        db = None
+        if state is not None:
+            state.save()
+    finally:
+        if db is not None:
+            db.discard()
+        if args.output:
+            f.close()
+        elif f is not None and args.format == 'json':
+            print()
+
+    _write_report(errors, args.keep_going)
+    _write_report(conflicts, args.conflicts)
+
+    if stats is not None:
+        report = stats.as_dict()
+        report['files'] = len(args.files)
+        report['total_seconds'] = time.perf_counter() - start
+        report = json.dumps(report, sort_keys=True, indent=2)
+        if args.profile == '-':
+            print(report, file=sys.stderr)
+        else:
+            with open(args.profile, 'w') as report_file:
+                report_file.write(report + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,37 @@
+import asyncio
+import bz2
+import gzip
+import io
+import json
+import lzma
+import os
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
 import unittest
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
 
-from pdf_text_scraper import PDFTextParser, TableType
+import pdf_text_scraper
+from bench_pdf_text_scraper import check_baseline, check_memory, generate_manual, long_description_table
+from pdf_text_scraper import (LAYOUT_PROFILES, LINE_FUNCTION, LINE_PAGE_NUMBER, LINE_TABLE, DirectoryWatcher,
+                              ExtractionServer, FunctionEntry, JSONLinesWriter, MappedText, MergeConflict, PageState,
+                              ParserStats, PDFTextParser, ResultCache, SQLiteWriter, TableError, TableInfo, TableType,
+                              diff_editions, extract_file_incremental, extract_file_tables, extract_files,
+                              extract_request, function_index, iter_layout_tables, iter_text_lines, layout_configs,
+                              merge_table_info, register_layout, write_json)
+
+
+def write_manual(directory, text, name='manual.txt', newline=None):
+    # text saved the way pdf2txt.py output is read, ISO-8859-1 with
+    # unencodable characters replaced; returns the file's path
+    filename = os.path.join(directory, name)
+    with open(filename, 'w', encoding='ISO-8859-1', errors='replace', newline=newline) as f:
+        f.write(text)
+    return filename
 
 
 class PDFTextParserTestCase(unittest.TestCase):
@@ -43,6 +74,8 @@ class PDFTextParserTestCase(unittest.TestCase):
         self.assertEqual(4, len(table_info['functions']))
         self.assertEqual(4, len(table_info['descriptions']))
         self.assertEqual(expected_first_table, table_info)
+        self.assertEqual(FunctionEntry('clock_setres', 'Set the clock resolution.Obsolete VxWorks-specific POSIX '
+                                                       'extension.'), table_info.entries()[1])
         self.assertEqual(53, pdf_p.idx)
 
         idx = pdf_p.find_next_table_idx()
@@ -108,6 +141,46 @@ class PDFTextParserTestCase(unittest.TestCase):
         self.assertEqual(expected_second_table_continued, table_info)
         self.assertEqual(161, pdf_p.idx)
 
+    def test_long_description_blocks(self):
+        for table_type in TableType:
+            text, blocks, page_size = long_description_table(table_type, block_lines=5000)
+            pdf_p = PDFTextParser()
+            pdf_p.configure({'PAGE_SIZE': page_size})
+            pdf_p.parse(text)
+            table_info = pdf_p.process_table_at_index(0)
+            self.assertEqual(table_type.value, table_info.type)
+            self.assertEqual(['long_function0', 'long_function1'], table_info.functions)
+            separator = '' if table_type == TableType.RoutinesFirst else ' '
+            self.assertEqual([separator.join(block) for block in blocks], table_info.descriptions)
+
+        # without a blank line within PAGE_SIZE the block is cut off
+        pdf_p = PDFTextParser()
+        text, blocks, _ = long_description_table(TableType.Intermingled, functions=1, block_lines=5000)
+        pdf_p.parse(text)
+        idx, description = pdf_p.extract_description_block_at_block(12)
+        self.assertEqual(12 + pdf_p.PAGE_SIZE - 1, idx)
+        self.assertEqual(' '.join(blocks[0][:pdf_p.PAGE_SIZE]), description.strip())
+
+    def test_check_baseline(self):
+        baseline = {'parser': {'seconds': 2.0, 'lines': 1000, 'lines_per_sec': 500.0},
+                    'classification': {'LineClassifier': 1000.0},
+                    'table_walk': {'str': {'seconds': 1.0, 'tables': 10, 'tables_per_sec': 10.0}},
+                    'description_blocks': {'Intermingled_1000': {'seconds': 1.0, 'lines': 2000}},
+                    'record_memory': {'slots': {'bytes': 100, 'peak_bytes': 120}}}
+        self.assertEqual([], check_baseline(baseline, baseline, 0.2))
+        results = {'parser': {'seconds': 2.0, 'lines': 1000, 'lines_per_sec': 450.0},
+                   'classification': {'LineClassifier': 700.0},
+                   'table_walk': {'str': {'seconds': 2.0, 'tables': 10, 'tables_per_sec': 5.0}},
+                   'description_blocks': {'Intermingled_1000': {'seconds': 2.0, 'lines': 2000}},
+                   'record_memory': {'slots': {'bytes': 1000, 'peak_bytes': 1200}}}
+        self.assertEqual(['classification/LineClassifier', 'table_walk/str', 'description_blocks/Intermingled_1000'],
+                         check_baseline(results, baseline, 0.2))
+
+        results = {'parser': {'rss_growth_kb': 200}, 'mmap': {'rss_growth_kb': 120}}
+        self.assertEqual([], check_memory(results))
+        results['mmap']['rss_growth_kb'] = 230
+        self.assertEqual(['mmap rss_growth_kb'], check_memory(results))
+
     def test_determine_table_header(self):
         pdf_p = PDFTextParser()
         pdf_p.parse(example_text_table_1)
@@ -170,6 +243,62 @@ class PDFTextParserTestCase(unittest.TestCase):
         idx = pdf_p.find_next_table_idx()
         self.assertEqual(None, idx)
 
+    def test_build_index(self):
+        pdf_p = PDFTextParser()
+        pdf_p.parse(example_text_table_1)
+
+        self.assertEqual([25, 83, 131], pdf_p.table_lines)
+        self.assertEqual([29, 87, 135], pdf_p.marker_lines)
+        self.assertEqual([39, 89, 137], pdf_p.description_lines)
+        self.assertEqual([0, 59, 126, 196], pdf_p.page_number_lines)
+        self.assertEqual(len([line for line in pdf_p.text if line == '']), len(pdf_p.blank_lines))
+
+    def test_line_classifier(self):
+        pdf_p = PDFTextParser()
+        self.assertIs(pdf_p.classifier, PDFTextParser().classifier)
+
+        classifier = pdf_p.classifier
+        self.assertEqual(LINE_TABLE, classifier.classify('Table 5-4'))
+        self.assertEqual(0, classifier.classify('Table 5.4 Table'))
+        self.assertEqual(LINE_PAGE_NUMBER, classifier.classify('262'))
+        self.assertEqual(0, classifier.classify('timer_create( )'))
+
+        # the lib name pattern matches lines directly, without a ' ' + line copy
+        for line in (example_text_table_1 + example_text_table_2).split('\n'):
+            line = line.strip()
+            old = re.match(r'.*\s(?P<lib_name>\w+Lib)', ' ' + line)
+            new = classifier.libname.match(line)
+            self.assertEqual(old and old['lib_name'], new and new['lib_name'])
+
+        pdf_p.parse(example_text_table_1)
+        self.assertEqual(('clock_getres', ''), pdf_p._function_at(31))
+        self.assertTrue(pdf_p.line_flags[31] & LINE_FUNCTION)
+        self.assertEqual((None, None), pdf_p._function_at(30))
+
+    def test_parser_stats(self):
+        text = example_text_table_1 + example_text_table_2
+        stats = ParserStats()
+        pdf_p = PDFTextParser(stats)
+        pdf_p.parse(text)
+        plain = PDFTextParser()
+        plain.parse(text)
+        expected = list(plain.iter_tables())
+        self.assertEqual(expected, list(pdf_p.iter_tables()))
+
+        self.assertEqual(len(pdf_p.text), stats.lines_scanned)
+        self.assertGreater(stats.regex_evaluations, stats.lines_scanned)
+        self.assertEqual({'RoutinesFirst': 1, 'Intermingled': 2}, stats.tables)
+        self.assertEqual(1, stats.tables_skipped)
+        self.assertEqual(set(ParserStats.PHASES), set(stats.seconds))
+        self.assertGreater(stats.seconds['parse'], 0)
+        self.assertGreater(stats.seconds['process_table_at_index'], 0)
+
+        total = ParserStats()
+        total.merge(stats)
+        total.merge(stats)
+        self.assertEqual(2 * stats.lines_scanned, total.as_dict()['lines_scanned'])
+        self.assertEqual({'RoutinesFirst': 2, 'Intermingled': 4}, total.as_dict()['tables'])
+
     def test_find_next_table(self):
         pdf_p = PDFTextParser()
         pdf_p.parse(example_text_table_1)
@@ -181,6 +310,668 @@ class PDFTextParserTestCase(unittest.TestCase):
         idx = pdf_p.find_next_table_idx()
         self.assertEqual(83, idx)
 
+    def test_iter_tables(self):
+        pdf_p = PDFTextParser()
+        pdf_p.parse(example_text_table_1 + example_text_table_2)
+        self.assertEqual([25, 83, 131], [idx for idx, _ in pdf_p.iter_tables()])
+        self.assertEqual([83], [idx for idx, _ in pdf_p.iter_tables(26, 131)])
+
+        # a table heading on the very first line is found too
+        lines = example_text_table_1.split('\n')[25:]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = write_manual(tmp_dir, '\n'.join(lines))
+            records = extract_file_tables(filename)
+        self.assertEqual([0, 58, 106], [idx for idx, _ in records])
+        self.assertEqual(['clock_getres', 'clock_setres'], records[0][1].functions[:2])
+
+    def test_layout_profiles(self):
+        # the fixture as another vendor would lay it out
+        other_text = example_text_table_1
+        for old, new in (('Table ', 'Listing '), ('Routine', 'Function'), ('Call', 'Entry'),
+                         ('Description', 'Purpose'), ('Lib', '_api')):
+            other_text = other_text.replace(old, new)
+        register_layout('other', {'table_heading': 'Listing', 'regex_table_marker': r'Function|Entry',
+                                  'description_header': 'Purpose',
+                                  'regex_libname': r'^(?:.*\s)?(?P<lib_name>\w+_api)',
+                                  'regex_table_name': r'^(?P<tbl_name>Listing\s+\d+-\d+)\s*?(?P<tbl_description>.*)'})
+        try:
+            with self.assertRaises(ValueError):
+                register_layout('broken', {'regex_routine': 'Routine'})
+            configs = layout_configs(['vxworks-6.6', 'other'])
+        finally:
+            del LAYOUT_PROFILES['other']
+
+        text = example_text_table_1 + other_text + example_text_table_2
+        parsers = PDFTextParser.parse_layouts(text, configs)
+        records = list(iter_layout_tables(parsers))
+        self.assertEqual([25, 83, 131, 223, 281, 329], [idx for idx, _ in records])
+        self.assertEqual(['clockLib', 'timerLib', None, 'clock_api', 'timer_api', None],
+                         [table_info.lib_name for _, table_info in records])
+        self.assertEqual('Listing 5-4', records[3][1].tbl_name)
+        self.assertEqual(records[0][1].descriptions, records[3][1].descriptions)
+
+        # the same indexes and tables as one parser per layout
+        def check(source, text):
+            for config, pdf_p in zip(configs, PDFTextParser.parse_layouts(source, configs)):
+                expected = PDFTextParser()
+                expected.configure(config)
+                expected.parse(text)
+                self.assertEqual(expected.line_flags, pdf_p.line_flags)
+                self.assertEqual(expected.blank_lines, pdf_p.blank_lines)
+                self.assertEqual(list(expected.iter_tables()), list(pdf_p.iter_tables()))
+
+        check(text, text)
+        numpy = pdf_text_scraper.load_numpy()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = write_manual(tmp_dir, text)
+            # a memory map is scanned once for all the layouts, with and without NumPy
+            try:
+                for np_module in (numpy, None):
+                    pdf_text_scraper.np = np_module
+                    mapped = MappedText(filename)
+                    check(mapped, text.encode('ISO-8859-1', 'replace').decode('ISO-8859-1'))
+                    mapped.close()
+            finally:
+                pdf_text_scraper.np = numpy
+
+            with open(filename, 'r', encoding='ISO-8859-1') as f:
+                records = list(iter_layout_tables(PDFTextParser.parse_layouts(f.read(), configs)))
+            self.assertEqual(records, extract_file_tables(filename, layouts=configs))
+            self.assertEqual(records, extract_file_tables(filename, 'mmap', layouts=configs))
+
+            # page footers of a layout whose pattern is not anchored at the line end
+            footers = re.sub(r'(?m)^(\d\d\d)$', r'Page \1 of 700', example_text_table_1 + example_text_table_2)
+            filename = write_manual(tmp_dir, footers)
+            configs = [dict(PDFTextParser().config(), regex_page_number=r'^Page \d+')]
+            expected = extract_file_tables(filename, layouts=configs)
+            self.assertNotEqual(extract_file_tables(filename), expected)
+            try:
+                for np_module in (numpy, None):
+                    pdf_text_scraper.np = np_module
+                    self.assertEqual(expected, extract_file_tables(filename, 'mmap', layouts=configs))
+            finally:
+                pdf_text_scraper.np = numpy
+
+    def test_stream_tables(self):
+        text = (example_text_table_1 + example_text_table_2) * 30
+
+        pdf_p = PDFTextParser()
+        pdf_p.parse(text)
+        expected = list(pdf_p.iter_tables())
+        self.assertEqual(90, len(expected))
+
+        pdf_p = PDFTextParser()
+        self.assertEqual(expected, list(pdf_p.stream_tables(io.StringIO(text))))
+        self.assertLess(len(pdf_p.text), 4 * (pdf_p.TABLE_TYPE_RANGE + 2 * pdf_p.PAGE_SIZE + 3))
+
+        # a long stretch without tables must not grow the window
+        text = example_text_table_1 + 'Prose about the clock routines.\n' * 20000 + example_text_table_2
+        pdf_p = PDFTextParser()
+        pdf_p.parse(text)
+        expected = list(pdf_p.iter_tables())
+        pdf_p = PDFTextParser()
+        window = []
+
+        def lines():
+            for line in io.StringIO(text):
+                window.append(len(pdf_p.text))
+                yield line
+
+        self.assertEqual(expected, list(pdf_p.stream_tables(lines())))
+        lookahead = pdf_p.TABLE_TYPE_RANGE + 2 * pdf_p.PAGE_SIZE + 3
+        self.assertLess(max(window), 4 * lookahead + pdf_p.SEARCH_BACKWARD_RANGE)
+
+    def test_table_at_end_of_text(self):
+        texts = {'Table 2-1  Routines\n\nRoutine\ntimer_create( ) Create a timer.\ntimer_delete( ) Delete it.':
+                 {'tbl_name': 'Table 2-1', 'tbl_description': 'Routines', 'lib_name': None, 'type': 1,
+                  'functions': ['timer_create', 'timer_delete'], 'descriptions': ['Create a timer.', 'Delete it.']},
+                 'Table 2-1\n\nRoutine\n\nDescription\n\nfoo( )\n\nDoes foo.':
+                 {'tbl_name': 'Table 2-1', 'tbl_description': 'Routine', 'lib_name': None, 'type': 2,
+                  'functions': ['foo'], 'descriptions': ['Does foo.']},
+                 'Table 2-1':
+                 {'tbl_name': 'Table 2-1', 'tbl_description': '', 'lib_name': None, 'type': None,
+                  'functions': [], 'descriptions': []}}
+        for text, expected in texts.items():
+            pdf_p = PDFTextParser()
+            pdf_p.parse(text)
+            self.assertEqual(expected, pdf_p.process_table_at_index(0))
+
+    def test_parse_file(self):
+        texts = [example_text_table_1 + example_text_table_2,
+                 (example_text_table_1 * 2).replace('\n', '\r\n'),
+                 example_text_table_1.replace('Table 5', '\xa0Table 5').replace('\n\n', '\n \x85\n'),
+                 # rows bytes patterns can not match like str patterns do
+                 example_text_table_1.replace('clock_gettime( )', 'clock_g\xe9ttime( )')
+                                     .replace('timer_getoverrun( ) Return', 'timer_getoverrun(\x1c) R\xe9turn'),
+                 '']
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for text in texts:
+                filename = write_manual(tmp_dir, text, newline='')
+                expected = PDFTextParser()
+                with open(filename, encoding='ISO-8859-1') as f:
+                    expected.parse(f.read())
+
+                pdf_p = PDFTextParser()
+                pdf_p.parse_file(filename)
+                self.assertIsInstance(pdf_p.text, MappedText)
+                self.assertEqual(list(expected.text), list(pdf_p.text))
+                self.assertEqual(expected.line_flags, pdf_p.line_flags)
+                self.assertEqual(list(expected.iter_tables()), list(pdf_p.iter_tables()))
+                pdf_p.text.close()
+
+            with open(filename, 'wb') as f:
+                f.write(b'a( ) x\n\xe9\n b\x1c\n\n c \r\n')
+            numpy = pdf_text_scraper.load_numpy()
+            for np in {numpy, None}:
+                pdf_text_scraper.np = np
+                try:
+                    text = MappedText(filename)
+                    self.assertEqual([b'a( ) x', None, None, b'', b'c', b''], [text.ascii_line(i) for i in range(6)])
+                    text.close()
+                finally:
+                    pdf_text_scraper.np = numpy
+
+            with open(filename, 'wb') as f:
+                f.write(b'Table 1\rRoutine')
+            with self.assertRaises(ValueError):
+                MappedText(filename)
+
+    @unittest.skipIf(pdf_text_scraper.load_numpy() is None, 'NumPy is not installed')
+    def test_bulk_index(self):
+        manual, _ = generate_manual(pages=40, tables=30)
+        texts = [manual, example_text_table_1 + example_text_table_2,
+                 (example_text_table_1 * 2).replace('\n', '\r\n'),
+                 example_text_table_1.replace('Table 5', '\xa0Table 5').replace('\n\n', '\n \x85\n'),
+                 'Table 1\n\nRoutine', '\n\n']
+
+        def indexes(pdf_p):
+            return (pdf_p.line_flags, pdf_p.blank_lines, pdf_p.table_lines, pdf_p.marker_lines,
+                    pdf_p.description_lines, pdf_p.page_number_lines)
+
+        def parse_all(filename, text):
+            pdf_p = PDFTextParser()
+            pdf_p.parse(text)
+            mapped_p = PDFTextParser()
+            mapped_p.parse_file(filename)
+            mapped_p.text.close()
+            return indexes(pdf_p), indexes(mapped_p)
+
+        numpy = pdf_text_scraper.load_numpy()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for text in texts:
+                text = text.encode('ISO-8859-1', 'replace').decode('ISO-8859-1')
+                filename = write_manual(tmp_dir, text, newline='')
+                bulk = parse_all(filename, text)
+                pdf_text_scraper.np = None
+                try:
+                    expected = parse_all(filename, text)
+                finally:
+                    pdf_text_scraper.np = numpy
+                self.assertEqual(expected, bulk)
+
+            # the buffer is looked at in chunks, lines and indexes must not depend on where they end
+            manual = manual.replace('Routine', 'R\xf6utine', 5)
+            filename = write_manual(tmp_dir, manual)
+            with mock.patch.object(MappedText, 'CHUNK_SIZE', 7):
+                mapped = MappedText(filename)
+                self.assertEqual([line.strip() for line in manual.split('\n')], list(mapped))
+                self.assertEqual([i for i, line in enumerate(manual.split('\n')) if '\xf6' in line],
+                                 [i for i in range(len(mapped)) if mapped.ascii_line(i) is None])
+                mapped.close()
+                self.assertEqual(*parse_all(filename, manual))
+
+    def test_lazy_imports(self):
+        # plain runs don't pay for importing NumPy or asyncio
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = write_manual(tmp_dir, example_text_table_1)
+            script = ('import sys, pdf_text_scraper; pdf_text_scraper.extract_file_tables(sys.argv[1]); '
+                      'print(sorted({"numpy", "asyncio"} & set(sys.modules)))')
+            output = subprocess.run([sys.executable, '-c', script, filename], check=True, capture_output=True,
+                                    text=True, cwd=os.path.dirname(os.path.abspath(pdf_text_scraper.__file__)))
+            self.assertEqual('[]', output.stdout.strip())
+
+    def test_iter_text_lines(self):
+        text = example_text_table_1 + '\x0c' + example_text_table_2
+        chunks = [text[i:i + 37] for i in range(0, len(text), 37)]
+        self.assertEqual(list(io.StringIO(text)), list(iter_text_lines(chunks)))
+        self.assertEqual(['a\n', '\n'], list(iter_text_lines(['a', '\n', '', '\n'])))
+
+        pdf_p = PDFTextParser()
+        pdf_p.parse(text)
+        expected = list(pdf_p.iter_tables())
+        self.assertEqual(expected, list(PDFTextParser().stream_tables(iter_text_lines(chunks))))
+
+        # PDF pages go through the same window, which long prose chapters must not grow
+        pages = [example_text_table_1] + ['Prose about the clock routines.\n' * 50 + '\x0c'] * 400
+        pages.append(example_text_table_2)
+        pdf_p = PDFTextParser()
+        pdf_p.parse(''.join(pages))
+        expected = list(pdf_p.iter_tables())
+        windows = []
+        build_index = PDFTextParser._timed_build_index
+
+        def timed_build_index(parser):
+            windows.append(len(parser.text))
+            return build_index(parser)
+
+        with mock.patch.object(pdf_text_scraper, 'iter_pdf_page_text', return_value=iter(pages)), \
+                mock.patch.object(PDFTextParser, '_timed_build_index', timed_build_index):
+            self.assertEqual(expected, extract_file_tables('manual.pdf'))
+        lookahead = pdf_p.TABLE_TYPE_RANGE + 2 * pdf_p.PAGE_SIZE + 3
+        self.assertLessEqual(max(windows), 4 * lookahead + pdf_p.SEARCH_BACKWARD_RANGE)
+
+    def test_compressed_inputs(self):
+        text = (example_text_table_1 + example_text_table_2).replace('\n', '\r\n')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = write_manual(tmp_dir, text, newline='')
+            expected = extract_file_tables(filename)
+            with open(filename, 'rb') as f:
+                data = f.read()
+            for extension, module in (('.gz', gzip), ('.bz2', bz2), ('.xz', lzma)):
+                compressed = filename + extension
+                with module.open(compressed, 'wb') as f:
+                    f.write(data)
+                for reader in ('read', 'stream', 'mmap'):
+                    self.assertEqual(expected, extract_file_tables(compressed, reader))
+                records, _ = extract_file_incremental(compressed, reader='mmap')
+                self.assertEqual(expected, records)
+
+    def test_diff_editions(self):
+        # extra whitespace, and a line break moved so words are glued differently, are not changes
+        new_text = example_text_table_1.replace('Set the clock resolution.', 'Set the clock  resolution.')
+        new_text = new_text.replace('(CLOCK_REALTIME andCLOCK_MONOTONIC)', '(CLOCK_REALTIMEand CLOCK_MONOTONIC)')
+        new_text = new_text.replace('clock_settime', 'clock_adjtime').replace('clock resolution (', 'tick (')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filenames = []
+            for name, text in (('old.txt', example_text_table_1), ('new.txt', new_text)):
+                filenames.append(write_manual(tmp_dir, text, name))
+            old_index = function_index(extract_file_tables(filenames[0]))
+            new_index = function_index(extract_file_tables(filenames[1]))
+            self.assertIn(('clockLib', None, 'clock_settime'), old_index)
+
+            report = diff_editions(old_index, new_index)
+            self.assertEqual({'added': 1, 'removed': 1, 'changed': 1, 'unchanged': len(old_index) - 2},
+                             report['summary'])
+            clock_lib = report['libs'][0]
+            self.assertEqual('clockLib', clock_lib['lib_name'])
+            self.assertEqual(['clock_adjtime'], [entry['name'] for entry in clock_lib['added']])
+            self.assertEqual(['clock_settime'], clock_lib['removed'])
+            self.assertEqual(['clock_getres'], [entry['name'] for entry in clock_lib['changed']])
+            self.assertEqual({'summary': {'added': 0, 'removed': 0, 'changed': 0, 'unchanged': len(old_index)},
+                              'libs': []}, diff_editions(old_index, dict(old_index)))
+
+            # functions of tables without a lib are told apart by table
+            records = [(0, TableInfo('Table 1-1', '', None, 1, ['init'], ['Start the timers.'])),
+                       (9, TableInfo('Table 1-2', '', None, 1, ['init'], ['Start the clocks.']))]
+            self.assertEqual(2, len(function_index(records)))
+            report = diff_editions(function_index(records), function_index(records[1:]))
+            self.assertEqual([{'lib_name': None, 'table_name': 'Table 1-1', 'removed': ['init']}], report['libs'])
+
+            report = diff_editions(old_index, new_index)
+            output = os.path.join(tmp_dir, 'diff.json')
+            pdf_text_scraper.main(['diff', '--old', filenames[0], '--new', filenames[1], '--no-cache', '-o', output])
+            with open(output) as f:
+                self.assertEqual(report, json.load(f))
+
+    def test_extract_file_tables_in_workers(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filenames = []
+            for i, text in enumerate([example_text_table_1, example_text_table_2, example_text_table_1 * 2]):
+                filenames.append(write_manual(tmp_dir, text, f'{i}.txt'))
+
+            serial = [extract_file_tables(filename) for filename in filenames]
+            self.assertEqual([3, 0, 6], [len(records) for records in serial])
+            with ProcessPoolExecutor(max_workers=2) as executor:
+                self.assertEqual(serial, list(executor.map(extract_file_tables, filenames)))
+
+    def test_sharded_tables(self):
+        pdf_p = PDFTextParser()
+        pdf_p.parse((example_text_table_1 + example_text_table_2) * 5)
+        expected = list(pdf_p.iter_tables())
+
+        self.assertEqual([(0, 1), (1, 60), (60, 127)], pdf_p.shard_bounds(1)[:3])
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            for pages_per_shard in (1, 2, 3, 100):
+                self.assertEqual(expected, list(pdf_p.sharded_tables(executor, pages_per_shard)))
+
+    def test_result_cache(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = write_manual(tmp_dir, example_text_table_1)
+
+            cache = ResultCache(os.path.join(tmp_dir, 'cache'))
+            config = PDFTextParser().config()
+            key = cache.key(filename, config)
+            self.assertIsNone(cache.get(key))
+
+            expected = extract_file_tables(filename)
+            # records are passed through as they are parsed, and cached once the file is complete
+            files = extract_files([filename], cache=cache)
+            self.assertEqual([(filename, expected)], [(name, list(records)) for name, records in files])
+            self.assertEqual(expected, cache.get(key))
+            # an entry evicted between loading it and bumping its mtime is still returned
+            with mock.patch.object(pdf_text_scraper.os, 'utime', side_effect=FileNotFoundError):
+                self.assertEqual(expected, cache.get(key))
+            self.assertEqual([(filename, expected)], list(extract_files([filename], cache=cache)))
+            for jobs in (1, 2):
+                files = extract_files([filename, filename], jobs, cache=None)
+                self.assertEqual([(filename, expected)] * 2, [(name, list(records)) for name, records in files])
+
+            config['PAGE_SIZE'] += 1
+            self.assertNotEqual(key, cache.key(filename, config))
+
+            cache.max_bytes = 0
+            cache.put('other', expected)
+            self.assertIsNone(cache.get(key))
+            self.assertEqual([], os.listdir(cache.cache_dir))
+
+    def test_keep_going(self):
+        text, _ = generate_manual(pages=60, tables=40)
+        pdf_p = PDFTextParser()
+        pdf_p.parse(text)
+        expected = list(pdf_p.iter_tables())
+        broken_idx = expected[10][0]
+        broken = pdf_p.text[broken_idx]
+        expected = [(idx, table_info) for idx, table_info in expected if idx != broken_idx]
+
+        get_table_name_and_description = PDFTextParser.get_table_name_and_description
+
+        def failing(pdf_p, idx):
+            if pdf_p.text[idx] == broken:
+                raise ValueError('broken table')
+            return get_table_name_and_description(pdf_p, idx)
+
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                mock.patch.object(PDFTextParser, 'get_table_name_and_description', failing):
+            filename = write_manual(tmp_dir, text)
+            with self.assertRaises(ValueError):
+                extract_file_tables(filename)
+
+            failure = TableError(filename, broken_idx, 'ValueError: broken table')
+            for reader in ('read', 'stream', 'mmap'):
+                errors = []
+                self.assertEqual(expected, extract_file_tables(filename, reader, errors=errors))
+                self.assertEqual([failure], errors)
+
+            cache = ResultCache(os.path.join(tmp_dir, 'cache'))
+            errors = []
+            results = [(name, list(records)) for name, records in extract_files([filename, filename], cache=cache,
+                                                                                  errors=errors)]
+            self.assertEqual([(filename, expected)] * 2, results)
+            self.assertEqual([failure], errors)
+            self.assertIsNone(cache.get(cache.key(filename, PDFTextParser().config())))
+
+    def test_incremental_extraction(self):
+        text, _ = generate_manual(pages=60, tables=40)
+        lines = text.split('\n')
+        # edit a line in the middle of the manual and insert a few lines
+        # near its start, so later tables move
+        lines[len(lines) // 2] += ' (revised)'
+        lines[100:100] = ['An inserted paragraph', 'over two lines.', '']
+        revised = '\n'.join(lines)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = write_manual(tmp_dir, text)
+            state = PageState(os.path.join(tmp_dir, 'out.json.pages.json'), PDFTextParser().config())
+            records = dict(extract_files([filename], state=state))[filename]
+            self.assertEqual(40, len(records))
+            state.save()
+
+            write_manual(tmp_dir, revised)
+            expected, _ = extract_file_incremental(filename)
+
+            state = PageState(state.path, PDFTextParser().config())
+            state.load()
+            pdf_p = PDFTextParser()
+            pdf_p.parse(revised)
+            known = pdf_p.reusable_tables(pdf_p.page_fingerprints(), state.files[filename])
+            self.assertLess(30, len(known))
+            self.assertGreater(40, len(known))
+            self.assertEqual(expected, dict(extract_files([filename], state=state))[filename])
+
+            config = PDFTextParser().config()
+            config['PAGE_SIZE'] += 1
+            state = PageState(state.path, config)
+            state.load()
+            self.assertEqual({}, state.files)
+
+            # from the CLI, where the result cache is on by default
+            plain = os.path.join(tmp_dir, 'plain.json')
+            pdf_text_scraper.main(['-f', filename, '-o', plain, '--no-cache'])
+            cache_dir = os.path.join(tmp_dir, 'cache')
+            for args in ([], ['-j', '2']):
+                output = os.path.join(tmp_dir, 'out.json')
+                for run in range(2):
+                    pdf_text_scraper.main(['-f', filename, '-o', output, '--incremental', '--cache-dir', cache_dir]
+                                          + args)
+                    with open(plain) as expected_file, open(output) as output_file:
+                        self.assertEqual(expected_file.read(), output_file.read())
+                os.remove(output + '.pages.json')
+
+            # a failed write leaves nothing behind in the cache directory
+            cache = ResultCache(cache_dir)
+            with mock.patch.object(pdf_text_scraper.json, 'dump', side_effect=ValueError('not serializable')):
+                with self.assertRaises(ValueError):
+                    cache.put('key', records)
+            self.assertEqual([], os.listdir(cache_dir))
+
+    def test_generated_manual(self):
+        text, counts = generate_manual(pages=60, tables=40)
+        pdf_p = PDFTextParser()
+        pdf_p.parse(text)
+
+        found = {TableType.RoutinesFirst.value: 0, TableType.Intermingled.value: 0}
+        for idx, table_info in pdf_p.iter_tables():
+            found[table_info['type']] += 1
+            self.assertEqual(len(table_info['functions']), len(table_info['descriptions']))
+            self.assertTrue(table_info['lib_name'].endswith('Lib'))
+        self.assertEqual(counts, found)
+        self.assertEqual(40, sum(counts.values()))
+        self.assertEqual(60, len(pdf_p.page_number_lines))
+
+    def test_write_json(self):
+        pdf_p = PDFTextParser()
+        pdf_p.parse(example_text_table_1)
+        library_dict = OrderedDict()
+        for idx, table_info in pdf_p.iter_tables():
+            merge_table_info(library_dict, idx, table_info)
+
+        f = io.StringIO()
+        write_json(library_dict, f)
+        self.assertEqual(['Table 5-4', 'Table 5-5'], list(library_dict))
+        self.assertEqual(14, len(library_dict['Table 5-5'].functions))
+        plain = {name: library_table.as_dict() for name, library_table in library_dict.items()}
+        self.assertEqual(json.dumps(plain, sort_keys=True, indent=2), f.getvalue())
+
+    def test_merge_deduplicates(self):
+        pdf_p = PDFTextParser()
+        pdf_p.parse(example_text_table_1)
+        records = list(pdf_p.iter_tables())
+        once = OrderedDict()
+        for idx, table_info in records:
+            merge_table_info(once, idx, table_info)
+
+        twice = OrderedDict()
+        conflicts = []
+        for idx, table_info in records + records:
+            merge_table_info(twice, idx, table_info, conflicts)
+        self.assertEqual([], conflicts)
+        self.assertEqual({name: table.as_dict() for name, table in once.items()},
+                         {name: table.as_dict() for name, table in twice.items()})
+
+        # a placeholder lib name is replaced by a found one, a found one is kept
+        library_dict = OrderedDict()
+        merge_table_info(library_dict, 7, TableInfo('Table 1-1', 'Atomics', None, 1, ['a'], ['Adds.']))
+        self.assertEqual('lib_at_7', library_dict['Table 1-1'].lib_name)
+        merge_table_info(library_dict, 9, TableInfo('Table 1-1', 'Atomics', 'lib_atomicLib', 1, ['a'], ['Adds.']))
+        merge_table_info(library_dict, 9, TableInfo('Table 1-1', 'Atomics', None, 1, ['b'], ['Bumps.']))
+        merge_table_info(library_dict, 9, TableInfo('Table 1-1', 'Atomics', 'lib_atomicLib', 1, ['a'], ['Adds.']),
+                         conflicts)
+        merge_table_info(library_dict, 9, TableInfo('Table 1-1', 'Atomics', 'lib_atomicLib', 1, ['a'], ['Sums.']),
+                         conflicts)
+        merge_table_info(library_dict, 9, TableInfo('Table 1-1', 'Atomics', 'otherLib', 1, ['a'], ['Adds.']),
+                         conflicts)
+        table = library_dict['Table 1-1']
+        self.assertEqual('lib_atomicLib', table.lib_name)
+        self.assertEqual(['a', 'b', 'a'], [entry.name for entry in table.functions])
+        self.assertEqual([MergeConflict('Table 1-1', 'a', 'description', 'Adds.', 'Sums.'),
+                          MergeConflict('Table 1-1', None, 'lib_name', 'lib_atomicLib', 'otherLib')], conflicts)
+
+    def test_json_lines_writer(self):
+        pdf_p = PDFTextParser()
+        pdf_p.parse(example_text_table_1)
+        records = list(pdf_p.iter_tables())
+
+        f = io.StringIO()
+        writer = JSONLinesWriter(f)
+        for idx, table_info in records:
+            writer.write('manual.txt', idx, table_info)
+        tables = [json.loads(line) for line in f.getvalue().splitlines()]
+        self.assertEqual([25, 83, 131], [table['line'] for table in tables])
+        self.assertEqual(['clockLib', 'timerLib', 'lib_at_131'], [table['lib_name'] for table in tables])
+        self.assertEqual({'name': 'clock_getres',
+                          'description': 'Get the clock resolution (CLOCK_REALTIME andCLOCK_MONOTONIC).'},
+                         tables[0]['functions'][0])
+
+        f = io.StringIO()
+        writer = JSONLinesWriter(f, per_function=True)
+        for idx, table_info in records:
+            writer.write('manual.txt', idx, table_info)
+        functions = [json.loads(line) for line in f.getvalue().splitlines()]
+        self.assertEqual(18, len(functions))
+        self.assertEqual({'file': 'manual.txt', 'line': 83, 'table_name': 'Table 5-5', 'lib_name': 'timerLib',
+                          'table_description': 'POSIX Timer Routines', 'description': 'Remove a previously created timer.',
+                          'name': 'timer_delete'},
+                         functions[5])
+
+    def test_sqlite_writer(self):
+        pdf_p = PDFTextParser()
+        pdf_p.parse(example_text_table_1)
+        records = list(pdf_p.iter_tables())
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'tables.db')
+            writer = SQLiteWriter(path)
+            writer.BATCH_TABLES = 2
+            for idx, table_info in records:
+                writer.write('manual.txt', idx, table_info)
+            writer.close()
+
+            db = sqlite3.connect(path)
+            self.assertEqual([('manual.txt', 83, 'Table 5-5', 'timerLib', 'Remove a previously created timer.')],
+                             db.execute('SELECT file, line, table_name, functions.lib_name, functions.description '
+                                        'FROM functions JOIN tables ON tables.id = table_id '
+                                        'WHERE name = ?', ('timer_delete',)).fetchall())
+            self.assertEqual(18, db.execute('SELECT count(*) FROM functions').fetchone()[0])
+            self.assertEqual(('lib_at_131',), db.execute('SELECT lib_name FROM tables WHERE line = 131').fetchone())
+            fts_query = "SELECT name FROM functions_fts WHERE functions_fts MATCH 'resolution'"
+            self.assertIn(('clock_getres',), db.execute(fts_query).fetchall())
+            plan = db.execute('EXPLAIN QUERY PLAN SELECT * FROM functions WHERE name = ?', ('x',)).fetchall()
+            self.assertIn('functions_name', str(plan))
+            db.close()
+
+            # a failed run leaves the previous database in place
+            writer = SQLiteWriter(path)
+            writer.write('other.txt', 0, records[0][1])
+            writer.discard()
+            self.assertEqual(['tables.db'], os.listdir(tmp_dir))
+            db = sqlite3.connect(path)
+            self.assertEqual(3, db.execute('SELECT count(*) FROM tables').fetchone()[0])
+            db.close()
+
+            # append mode adds to the database and keeps the full-text index current
+            writer = SQLiteWriter(path, append=True)
+            writer.write('other.txt', 0, records[0][1])
+            writer.flush()
+            writer.remove_file('manual.txt')
+            writer.close()
+            db = sqlite3.connect(path)
+            self.assertEqual([('other.txt',)], db.execute('SELECT file FROM tables').fetchall())
+            self.assertEqual([('clock_getres',), ('clock_setres',)], db.execute(fts_query).fetchall())
+            db.close()
+
+    def test_directory_watcher(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            directory = os.path.join(tmp_dir, 'incoming')
+            os.mkdir(directory)
+            texts = {'a.txt': example_text_table_1, 'b.txt': example_text_table_2, 'c.txt': example_text_table_1}
+            for name, text in texts.items():
+                write_manual(directory, text, name)
+            with open(os.path.join(directory, 'notes.md'), 'w') as f:
+                f.write('not a manual')
+
+            emitted = []
+            state_path = os.path.join(tmp_dir, 'out.jsonl.watch.json')
+
+            def emit(filename, records, changed):
+                emitted.append((os.path.basename(filename), records, changed))
+
+            watcher = DirectoryWatcher(directory, emit, max_pending=1, state_path=state_path)
+            try:
+                # files are queued once they stopped changing between two polls, one at a time
+                watcher.poll()
+                self.assertEqual({}, watcher.pending)
+                for _ in range(10):
+                    watcher.poll(timeout=5)
+                    self.assertLessEqual(len(watcher.pending), 1)
+                    if len(emitted) == 3 and not watcher.pending:
+                        break
+                self.assertEqual(['a.txt', 'b.txt', 'c.txt'], sorted(name for name, _, _ in emitted))
+                for name, records, changed in emitted:
+                    self.assertFalse(changed)
+                    self.assertEqual(extract_file_tables(os.path.join(directory, name)), records)
+
+                with open(os.path.join(directory, 'b.txt'), 'a') as f:
+                    f.write('\n\n')
+                for _ in range(3):
+                    watcher.poll(timeout=5)
+                self.assertEqual(('b.txt', True), emitted[-1][::2])
+                self.assertEqual(4, len(emitted))
+            finally:
+                watcher.close()
+
+            # a restart only picks up what changed since
+            watcher = DirectoryWatcher(directory, emit, state_path=state_path)
+            try:
+                for _ in range(3):
+                    watcher.poll(timeout=5)
+            finally:
+                watcher.close()
+            self.assertEqual(4, len(emitted))
+
+    def test_extraction_server(self):
+        async def request(address, payload):
+            reader, writer = await asyncio.open_unix_connection(address)
+            writer.write(payload + b'\n')
+            response = json.loads(await reader.readline())
+            writer.close()
+            return response
+
+        async def run(address, filename):
+            server = await ExtractionServer(max_concurrent=1).start(address)
+            async with server:
+                return await asyncio.gather(
+                    request(address, json.dumps({'id': 1, 'files': [filename, filename]}).encode()),
+                    request(address, json.dumps({'id': 2, 'texts': [example_text_table_2]}).encode()),
+                    request(address, json.dumps({'id': 3, 'files': [filename + '.missing']}).encode()),
+                    request(address, b'[1, 2]'),
+                    request(address, json.dumps({'id': 5, 'files': filename}).encode()),
+                    request(address, json.dumps({'id': 6, 'texts': [example_text_table_2, 7]}).encode()))
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = write_manual(tmp_dir, example_text_table_1)
+            responses = asyncio.run(run(os.path.join(tmp_dir, 'server.sock'), filename))
+            library_dict = extract_request({'files': [filename, filename]})
+
+        self.assertEqual({name: json.loads(json.dumps(table.as_dict())) for name, table in library_dict.items()},
+                         responses[0]['tables'])
+        self.assertEqual(2, responses[1]['id'])
+        self.assertEqual({}, responses[1]['tables'])
+        self.assertTrue(responses[2]['error'].startswith('FileNotFoundError'))
+        for response in responses[3:]:
+            self.assertIn('bad request', response['error'])
+        for response in responses[:3]:
+            self.assertEqual({'queued', 'extract', 'total'}, set(response['timing']))
+
     def test_parse_text(self):
         pdf_p = PDFTextParser()
         self.assertTrue(isinstance(pdf_p, PDFTextParser))